@@ -4,6 +4,10 @@ from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from app.routes import search, grid, frame, panel
+from app.services.redis_service import async_redis_service
+from app.services.search_coordinator import SearchCoordinator
+from app.utils.embedder.embedding_cache import embedding_cache
+from app.utils.stage_executor import stage_executor
 from config import Config
 from app.log import logger
 
@@ -26,6 +30,32 @@ app.add_middleware(
 )
 
 
+@app.on_event("shutdown")
+async def close_redis():
+    await async_redis_service.close()
+
+
+@app.on_event("shutdown")
+def save_embedding_cache():
+    embedding_cache.save()
+
+
+@app.on_event("shutdown")
+def close_text_embedder():
+    search.text_embedder.close()
+
+
+@app.on_event("shutdown")
+async def close_search_coordinator():
+    if isinstance(search.search_service, SearchCoordinator):
+        await search.search_service.close()
+
+
+@app.on_event("shutdown")
+def shutdown_stage_executor():
+    stage_executor.shutdown()
+
+
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
     logger.info("Rendering index page")
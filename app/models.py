@@ -1,4 +1,5 @@
-from typing import Optional, Dict, List, Union, Tuple
+from typing import NamedTuple, Optional, Dict, List, Union, Tuple
+import numpy as np
 from pydantic import BaseModel, Field, validator
 from enum import Enum
 
@@ -96,6 +97,9 @@ class ObjectQuery(BaseModel):
                    List[Tuple[int, str]]] = Field(default_factory=dict)
     logic: QueryLogic = QueryLogic.AND
     max_objects: Optional[int] = None
+    # Also match objects up to this many grid cells away from where they
+    # were placed, at a lower score.
+    spatial_tolerance: int = Field(0, ge=0)
 
     @validator('objects', pre=True)
     def parse_objects(cls, v):
@@ -112,16 +116,39 @@ class ObjectQuery(BaseModel):
             max_objects=int(max_objects) if max_objects is not None else None
         )
 
-    def parse_query(self) -> List[str]:
+    def cells(self) -> List[Tuple[str, Category]]:
+        """``(grid cell, category)`` of every placed object; cells are labelled ``<col><row>`` like ``a0``.
+
+        Positions are the grid's ``(row, col)`` tuples, or their ``"row,col"``
+        form once the query went through JSON, e.g. to a shard worker:
+
+        >>> query = ObjectQuery()
+        >>> query.objects = {(3, 'c'): Category.PERSON}
+        >>> ObjectQuery(**query.model_dump(mode='json')).cells() == query.cells() == [('c3', Category.PERSON)]
+        True
+        """
         result = []
         for position, category in self.objects.items():
-            value = category.value.strip().lower().replace(' ', '')
-            result.append(f"{position[1]}{position[0]}{value}")
+            if isinstance(position, str) and ',' in position:
+                row, col = position.split(',')
+            else:
+                row, col = position[0], position[1]
+            result.append((f"{col}{row}", category))
         return result
 
+    def parse_query(self) -> List[str]:
+        return [f"{cell}{category.value.strip().lower().replace(' ', '')}"
+                for cell, category in self.cells()]
+
 
 class TextQuery(BaseModel):
     query: str
+    nprobe: Optional[int] = Field(None, ge=1)
+    ef_search: Optional[int] = Field(None, ge=1)
+
+    def search_params(self) -> Dict[str, int]:
+        params = {'nprobe': self.nprobe, 'efSearch': self.ef_search}
+        return {name: value for name, value in params.items() if value is not None}
 
 
 class TagQuery(BaseModel):
@@ -140,10 +167,28 @@ class Searcher(BaseModel):
         return v
 
 
+class SearchFilter(BaseModel):
+    """Restricts every searcher to frames of the given videos, batches and time range.
+
+    ``batches`` are video id prefixes such as ``L01``; a frame passes when its
+    video matches either list (or both lists are empty) and its timestamp is
+    within ``[min_timestamp, max_timestamp]``.
+    """
+    video_ids: List[str] = Field(default_factory=list)
+    batches: List[str] = Field(default_factory=list)
+    min_timestamp: Optional[float] = Field(None, ge=0.0)
+    max_timestamp: Optional[float] = Field(None, ge=0.0)
+
+    def is_empty(self) -> bool:
+        return not (self.video_ids or self.batches
+                    or self.min_timestamp is not None or self.max_timestamp is not None)
+
+
 class QueriesStructure(BaseModel):
     text_searcher: Optional[Searcher] = None
     object_detection_searcher: Optional[Searcher] = None
     tag_searcher: Optional[Searcher] = None
+    filters: Optional[SearchFilter] = None
 
 
 class SearchRequest(BaseModel):
@@ -178,6 +223,31 @@ class SearchRequest(BaseModel):
         )
 
 
+class ShardRankRequest(BaseModel):
+    """A query prepared by the search coordinator for one shard worker.
+
+    Text arrives already embedded and tags already resolved to known terms,
+    so workers need neither the CLIP model nor the text processor.
+    """
+    text_vector: Optional[List[float]] = None
+    text_search_params: Dict[str, int] = Field(default_factory=dict)
+    tag_terms: Optional[List[str]] = None
+    object_query: Optional[ObjectQuery] = None
+    filters: Optional[SearchFilter] = None
+    depth: int = Field(..., ge=1)
+    boost_factors: Optional[Dict[str, float]] = None
+
+
+class StageRanking(BaseModel):
+    """Global frame indices and raw stage scores, best first; higher scores are better (text sends inner products)."""
+    frame_indices: List[int] = Field(default_factory=list)
+    scores: List[float] = Field(default_factory=list)
+
+
+class ShardRankResponse(BaseModel):
+    stages: Dict[str, StageRanking] = Field(default_factory=dict)
+
+
 class ObjectDetectionItem(BaseModel):
     score: float
     box: List[float]
@@ -260,9 +330,31 @@ class SearchResult(BaseModel):
     total: int
     page: int
     has_more: bool
+    completed_stages: List[str] = Field(default_factory=list)
+    timed_out_stages: List[str] = Field(default_factory=list)
 
     @validator('total', 'page')
     def check_positive(cls, v):
         if v < 0:
             raise ValueError('Value must be non-negative')
         return v
+
+
+class RankedCandidates(NamedTuple):
+    """Ranked frame indices with their scores, best first."""
+    frame_indices: np.ndarray
+    scores: np.ndarray
+    completed_stages: Tuple[str, ...] = ()
+    timed_out_stages: Tuple[str, ...] = ()
+
+    @classmethod
+    def empty(cls) -> 'RankedCandidates':
+        return cls(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+    @property
+    def size(self) -> int:
+        return len(self.frame_indices)
+
+    @property
+    def nbytes(self) -> int:
+        return self.frame_indices.nbytes + self.scores.nbytes
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Request, Form, HTTPException
+from fastapi import APIRouter, Request, Form, HTTPException, Query
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
 from typing import Optional
@@ -21,10 +21,10 @@ async def toggle_frame(request: Request, frame_id: str = Form(...), score: float
     try:
         logger.info(
             f"Received toggle request for frame_id: {frame_id}, score: {score}")
-        frame_data_manager.toggle_frame_selection(frame_id, score)
+        await frame_data_manager.toggle_frame_selection(frame_id, score)
 
-        frame = frame_data_manager.get_frame_by_key(frame_id)
-        selected_frames = frame_data_manager.get_selected_frames()
+        frame = await frame_data_manager.get_frame_by_key(frame_id)
+        selected_frames = await frame_data_manager.get_selected_frames()
 
         frame_card_html = templates.TemplateResponse(
             "components/frame_card.html",
@@ -52,16 +52,25 @@ async def toggle_frame(request: Request, frame_id: str = Form(...), score: float
 
 @router.get("/get_frame_card/{frame_id}", response_class=HTMLResponse)
 async def get_frame_card(request: Request, frame_id: str):
-    frame = frame_data_manager.get_frame_by_key(frame_id)
+    frame = await frame_data_manager.get_frame_by_key(frame_id)
     if frame is None:
         raise HTTPException(
             status_code=404, detail=f"Frame not found: {frame_id}")
     return templates.TemplateResponse("components/frame_card.html", {"request": request, "frame": frame})
 
 
+@router.get("/similar_frames/{frame_id}", response_class=HTMLResponse)
+async def similar_frames(request: Request, frame_id: str, k: int = Query(50, ge=1, le=500)):
+    if not frame_data_manager.has_frame(frame_id):
+        raise HTTPException(
+            status_code=404, detail=f"Frame not found: {frame_id}")
+    frames = await frame_data_manager.search_frames_like(frame_id, k)
+    return templates.TemplateResponse("components/search_results.html", {"request": request, "results": frames})
+
+
 @router.get("/get_selected_frames", response_class=HTMLResponse)
 async def get_selected_frames(request: Request):
-    frames = frame_data_manager.get_selected_frames()
+    frames = await frame_data_manager.get_selected_frames()
     return templates.TemplateResponse("components/selected_frames.html", {"request": request, "frames": frames})
 
 
@@ -77,7 +86,7 @@ async def submit_single_frame(request: Request, frame_id: str = Form(...)):
 
 @router.post("/submit_all_frames", response_class=HTMLResponse)
 async def submit_all_frames(request: Request):
-    selected_frames = frame_data_manager.get_selected_frames()
+    selected_frames = await frame_data_manager.get_selected_frames()
     existing_files = get_existing_csv_files()
     return templates.TemplateResponse("modals/confirm_submit_all.html", {
         "request": request,
@@ -88,7 +97,7 @@ async def submit_all_frames(request: Request):
 
 @router.get("/get_file_contents", response_class=HTMLResponse)
 async def get_file_contents_route(request: Request, file_name: str):
-    contents = get_file_contents(file_name)
+    contents = await get_file_contents(file_name)
     return templates.TemplateResponse("components/file_contents.html", {
         "request": request,
         "contents": contents,
@@ -109,12 +118,12 @@ async def create_file(request: Request, new_file_name: str = Form(...)):
 
 @router.post("/add_frame_to_file", response_class=HTMLResponse)
 async def add_frame_to_file_route(request: Request, file_name: str = Form(...), frame_id: str = Form(...)):
-    frame = frame_data_manager.get_frame_by_key(frame_id)
+    frame = await frame_data_manager.get_frame_by_key(frame_id)
     if frame is None:
         raise HTTPException(
             status_code=404, detail=f"Frame not found: {frame_id}")
     add_frame_to_file(frame, file_name)
-    contents = get_file_contents(file_name)
+    contents = await get_file_contents(file_name)
     return templates.TemplateResponse("components/file_contents.html", {
         "request": request,
         "contents": contents,
@@ -125,7 +134,7 @@ async def add_frame_to_file_route(request: Request, file_name: str = Form(...),
 @router.post("/remove_frame_from_file", response_class=HTMLResponse)
 async def remove_frame_from_file_route(request: Request, file_name: str = Form(...), frame_id: str = Form(...)):
     remove_frame_from_file(frame_id, file_name)
-    contents = get_file_contents(file_name)
+    contents = await get_file_contents(file_name)
     return templates.TemplateResponse("components/file_contents.html", {
         "request": request,
         "contents": contents,
@@ -141,7 +150,7 @@ async def confirm_submit_single(
     new_file_name: Optional[str] = Form(None)
 ):
     try:
-        frame = frame_data_manager.get_frame_by_key(frame_id)
+        frame = await frame_data_manager.get_frame_by_key(frame_id)
         if frame is None:
             raise FrameNotFoundError(f"Frame not found: {frame_id}")
 
@@ -149,7 +158,7 @@ async def confirm_submit_single(
             file_name = create_new_csv_file(new_file_name)
 
         await save_single_frame_to_csv(frame, file_name)
-        frame_data_manager.remove_frame_selection(frame_id)
+        await frame_data_manager.remove_frame_selection(frame_id)
 
         return templates.TemplateResponse("index.html", {"request": request})
     except Exception as e:
@@ -165,7 +174,7 @@ async def confirm_submit_all(
     new_file_name: Optional[str] = Form(None)
 ):
     try:
-        selected_frames = frame_data_manager.get_selected_frames()
+        selected_frames = await frame_data_manager.get_selected_frames()
 
         if new_file_name:
             file_name = create_new_csv_file(new_file_name)
@@ -175,7 +184,7 @@ async def confirm_submit_all(
 
         for frame in selected_frames:
             await save_single_frame_to_csv(frame, file_name)
-            frame_data_manager.remove_frame_selection(frame.id)
+            await frame_data_manager.remove_frame_selection(frame.id)
 
         return templates.TemplateResponse("index.html", {"request": request})
     except Exception as e:
@@ -187,7 +196,7 @@ async def confirm_submit_all(
 @router.get("/get_file_contents", response_class=HTMLResponse)
 async def get_file_contents_route(request: Request, file_name: str):
     try:
-        contents = get_file_contents(file_name)
+        contents = await get_file_contents(file_name)
         return templates.TemplateResponse("components/file_contents.html", {
             "request": request,
             "contents": contents,
@@ -1,10 +1,12 @@
-from typing import List
+from typing import List, Optional
 from fastapi import APIRouter, Form, Query, Request, HTTPException
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
-from app.models import FrameMetadataModel, ObjectQuery, QueriesStructure, SearchRequest, Searcher, TagQuery, TextQuery
+from app.models import FrameMetadataModel, ObjectQuery, QueriesStructure, SearchFilter, SearchRequest, Searcher, TagQuery, TextQuery
+from app.services.candidate_cache import CandidateCache
 from app.services.fusion.simple_fusion import SimpleFusion
 from app.services.reranker.simple_reranker import SimpleReranker
+from app.services.search_coordinator import SearchCoordinator
 from app.services.search_service import SearchService
 from app.services.search_service_v2 import SearchServiceV2
 from app.services.searcher.object_detection_searcher import ObjectDetectionSearcher
@@ -12,12 +14,17 @@ from app.services.searcher.tag_searcher import TagSearcher
 from app.services.searcher.text_searcher import TextSearcher
 from app.services.searcher.text_searcher_v2 import TextSearcherV2
 from app.log import logger
+from app.utils.binary_index import BinaryIndex
+from app.utils.embedder.batching_embedder import BatchingEmbedder
+from app.utils.embedder.embedding_cache import embedding_cache
 from app.utils.embedder.open_clip_embedder import OpenClipEmbedder
-from app.utils.indexer import FaissIndexer
+from app.utils.indexer import ShardedFaissIndexer, faiss_index_registry
+from app.utils.object_bitmap_index import ObjectBitmapIndex
 from app.utils.query_vectorizer.object_detection_vectorizer import ObjectQueryVectorizer
 from app.utils.query_vectorizer.tag_vectorizer import TagQueryVectorizer
 from app.utils.query_vectorizer.text_vectorizer import TextQueryVectorizer
 from app.utils.search_processor import TextProcessor
+from app.utils.stage_executor import stage_executor
 from app.utils.data_manager.grid_manager import grid_manager
 from app.utils.data_manager.tag_manager import tags_list
 from app.utils.data_manager.frame_data_manager import frame_data_manager
@@ -28,31 +35,48 @@ logger = logger.getChild(__name__)
 router = APIRouter()
 templates = Jinja2Templates(directory="app/templates")
 
-indexer = FaissIndexer(index_path=Config.FAISS_BIN_PATH)
-feature_shape = (indexer.index.d,)
-
-text_embedder = OpenClipEmbedder(
-    model_name=Config.CLIP_MODEL_NAME, feature_shape=feature_shape)
+candidate_cache = CandidateCache()
 text_processor = TextProcessor()
 
-text_query_vectorizer = TextQueryVectorizer(
-    text_embedder, text_processor, indexer)
-tag_query_vectorizer = TagQueryVectorizer(text_processor, tags_list)
-object_detection_vectorizer = ObjectQueryVectorizer()
-
-text_searcher = TextSearcher(text_query_vectorizer)
-text_searcher_v2 = TextSearcherV2(text_query_vectorizer)
-tag_searcher = TagSearcher(tag_query_vectorizer)
-object_detection_searcher = ObjectDetectionSearcher(
-    object_detection_vectorizer)
-
-fusion = SimpleFusion()
-reranker = SimpleReranker()
-
-search_service = SearchService(
-    text_searcher, object_detection_searcher, tag_searcher, fusion, reranker)
-search_service_v2 = SearchServiceV2(
-    text_searcher_v2, object_detection_searcher, tag_searcher, fusion, reranker)
+if Config.SEARCH_SHARD_URLS:
+    # Coordinator mode: the shard workers own the CLIP index and searchers,
+    # this process only embeds queries and hydrates the final page.
+    indexer = None
+    text_embedder = BatchingEmbedder(OpenClipEmbedder(
+        model_name=Config.CLIP_MODEL_NAME))
+    text_query_vectorizer = TextQueryVectorizer(
+        text_embedder, text_processor, None, embedding_cache=embedding_cache)
+    search_service = SearchCoordinator(
+        Config.SEARCH_SHARD_URLS, text_query_vectorizer, text_processor, tags_list,
+        candidate_cache=candidate_cache)
+else:
+    indexer = faiss_index_registry.get(Config.FAISS_BIN_PATH)
+    feature_shape = (indexer.d,)
+
+    text_embedder = BatchingEmbedder(OpenClipEmbedder(
+        model_name=Config.CLIP_MODEL_NAME, feature_shape=feature_shape))
+
+    text_query_vectorizer = TextQueryVectorizer(
+        text_embedder, text_processor, indexer, embedding_cache=embedding_cache,
+        binary_index=BinaryIndex.load() if Config.TEXT_SEARCH_MODE == 'binary' else None)
+    tag_query_vectorizer = TagQueryVectorizer(text_processor, tags_list)
+    object_detection_vectorizer = ObjectQueryVectorizer(
+        ObjectBitmapIndex.from_store(frame_data_manager.store))
+
+    text_searcher = TextSearcher(text_query_vectorizer)
+    text_searcher_v2 = TextSearcherV2(text_query_vectorizer)
+    tag_searcher = TagSearcher(tag_query_vectorizer)
+    object_detection_searcher = ObjectDetectionSearcher(
+        object_detection_vectorizer)
+
+    fusion = SimpleFusion()
+    reranker = SimpleReranker()
+
+    search_service = SearchService(
+        text_searcher, object_detection_searcher, tag_searcher, fusion, reranker,
+        candidate_cache=candidate_cache)
+    search_service_v2 = SearchServiceV2(
+        text_searcher_v2, object_detection_searcher, tag_searcher, fusion, reranker)
 
 weights = {
     'text': 50,
@@ -151,7 +175,14 @@ async def search(
     selected_tags: List[str] = Query([]),
     use_tag_inference: bool = Query(False),
     page: int = Query(1, ge=1),
-    per_page: int = Query(200, ge=1, le=500)
+    per_page: int = Query(200, ge=1, le=500),
+    nprobe: Optional[int] = Query(None, ge=1),
+    ef_search: Optional[int] = Query(None, ge=1),
+    video_ids: List[str] = Query([]),
+    batches: List[str] = Query([]),
+    min_timestamp: Optional[float] = Query(None, ge=0),
+    max_timestamp: Optional[float] = Query(None, ge=0),
+    spatial_tolerance: int = Query(0, ge=0)
 ):
     global current_results
     try:
@@ -164,7 +195,11 @@ async def search(
             logger.info(
                 f"Translated query: '{text_query}' to '{translated_query}'")
 
-        object_query = ObjectQuery()
+        max_objects = grid_manager.get_max_objects()
+        object_query = ObjectQuery(
+            logic=grid_manager.get_panel_logic(),
+            max_objects=int(max_objects) if max_objects else None,
+            spatial_tolerance=spatial_tolerance)
         object_query.objects = grid_manager.get_state()
 
         tag_query = TagQuery(query="", entities=selected_tags)
@@ -173,11 +208,14 @@ async def search(
 
         queries = QueriesStructure(
             text_searcher=Searcher(query=TextQuery(
-                query=translated_query), weight=weights['text']/100) if translated_query else None,
+                query=translated_query, nprobe=nprobe, ef_search=ef_search), weight=weights['text']/100) if translated_query else None,
             object_detection_searcher=Searcher(
                 query=object_query, weight=weights['object']/100) if object_query.objects else None,
             tag_searcher=Searcher(query=tag_query, weight=weights['tag']/100) if (
                 selected_tags or (use_tag_inference and translated_query)) else None,
+            filters=SearchFilter(
+                video_ids=video_ids, batches=batches,
+                min_timestamp=min_timestamp, max_timestamp=max_timestamp),
         )
 
         search_request = SearchRequest(
@@ -191,6 +229,9 @@ async def search(
         results = await search_service.search(search_request.queries, use_tag_inference, page=page, per_page=per_page)
         # results = await search_service_v2.search(search_request.queries, use_tag_inference, page=page, per_page=per_page)
         logger.info(f"Found: {len(results.frames)} results")
+        if results.timed_out_stages:
+            logger.warning(
+                f"Search stages missed their deadline: {results.timed_out_stages}")
         current_results.extend(results.frames)
 
         context = {
@@ -217,11 +258,46 @@ async def search(
             status_code=500, detail="An error occurred while searching. Please try again later.")
 
 
+def get_sharded_indexer() -> ShardedFaissIndexer:
+    if not isinstance(indexer, ShardedFaissIndexer):
+        raise HTTPException(
+            status_code=404, detail="The CLIP index is not sharded")
+    return indexer
+
+
+@router.get("/shards")
+async def list_shards():
+    sharded_indexer = get_sharded_indexer()
+    return {"available": sharded_indexer.available_shards, "loaded": sharded_indexer.shard_names}
+
+
+@router.post("/shards/{name}/load")
+async def load_shard(name: str):
+    sharded_indexer = get_sharded_indexer()
+    try:
+        await stage_executor.run(sharded_indexer.load_shard, name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    candidate_cache.clear()
+    return {"loaded": sharded_indexer.shard_names}
+
+
+@router.post("/shards/{name}/unload")
+async def unload_shard(name: str):
+    sharded_indexer = get_sharded_indexer()
+    try:
+        sharded_indexer.unload_shard(name)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    candidate_cache.clear()
+    return {"loaded": sharded_indexer.shard_names}
+
+
 @router.post("/auto_select_frames", response_class=HTMLResponse)
 async def auto_select_frames(request: Request, max_items: int = Form(100)):
     global current_results
     try:
-        selected_frames = frame_data_manager.get_selected_frames()
+        selected_frames = await frame_data_manager.get_selected_frames()
         current_count = len(selected_frames)
 
         frames_to_select = max(0, min(max_items - current_count, 100))
@@ -230,11 +306,11 @@ async def auto_select_frames(request: Request, max_items: int = Form(100)):
             if frames_to_select == 0:
                 break
             if not frame.selected:
-                frame_data_manager.toggle_frame_selection(
+                await frame_data_manager.toggle_frame_selection(
                     frame.id, score=frame.final_score)
                 frames_to_select -= 1
 
-        updated_selected_frames = frame_data_manager.get_selected_frames()
+        updated_selected_frames = await frame_data_manager.get_selected_frames()
 
         return templates.TemplateResponse("components/selected_frames.html", {
             "request": request,
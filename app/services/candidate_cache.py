@@ -0,0 +1,112 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from app.log import logger
+from app.models import ObjectQuery, QueriesStructure, RankedCandidates, TagQuery, TextQuery
+from config import Config
+
+logger = logger.getChild(__name__)
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(text.lower().split())
+
+
+class CandidateCache:
+    """LRU + TTL cache of fully ranked candidate lists, keyed by the query.
+
+    The first request for a query stores its ranked ``(frame_index, score)``
+    arrays; later pages of the same query are served as slices of them.
+    Entries expire after ``ttl_seconds`` and the least recently used ones are
+    evicted once ``max_entries`` or ``max_bytes`` is exceeded.
+    """
+
+    def __init__(self,
+                 max_entries: int = Config.CANDIDATE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = Config.CANDIDATE_CACHE_TTL_SECONDS,
+                 max_bytes: int = Config.CANDIDATE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[float, RankedCandidates]]' = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, queries: QueriesStructure, boost_factors: Optional[Dict[str, float]] = None, **extra) -> str:
+        """Key a search by its normalized queries, weights, grid state, tags, filters and any ``extra`` options."""
+        parts = {name: self._describe_searcher(searcher)
+                 for name, searcher in (
+                     ('text', queries.text_searcher),
+                     ('object', queries.object_detection_searcher),
+                     ('tag', queries.tag_searcher))
+                 if searcher is not None}
+        if queries.filters is not None and not queries.filters.is_empty():
+            filters = queries.filters
+            parts['filters'] = {
+                'video_ids': sorted(set(filters.video_ids)),
+                'batches': sorted(set(filters.batches)),
+                'min_timestamp': filters.min_timestamp,
+                'max_timestamp': filters.max_timestamp,
+            }
+        if boost_factors:
+            parts['boost'] = sorted(boost_factors.items())
+        if extra:
+            parts['extra'] = sorted(extra.items())
+        encoded = json.dumps(parts, sort_keys=True, default=str)
+        return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+    def _describe_searcher(self, searcher) -> Dict:
+        query = searcher.query
+        description = {'weight': round(searcher.weight, 6)}
+        if isinstance(query, TextQuery):
+            description['query'] = normalize_text(query.query)
+            description['search_params'] = sorted(query.search_params().items())
+        elif isinstance(query, ObjectQuery):
+            description['objects'] = sorted(
+                (str(position), category.value) for position, category in query.objects.items())
+            description['logic'] = query.logic.value
+            description['max_objects'] = query.max_objects
+            description['spatial_tolerance'] = query.spatial_tolerance
+        elif isinstance(query, TagQuery):
+            description['query'] = normalize_text(query.query)
+            description['entities'] = sorted(set(query.entities))
+        return description
+
+    def get(self, key: str) -> Optional[RankedCandidates]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, candidates = entry
+            if time.monotonic() - created_at > self.ttl_seconds:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return candidates
+
+    def put(self, key: str, candidates: RankedCandidates):
+        if candidates.nbytes > self.max_bytes:
+            logger.warning(
+                f'Candidate list of {candidates.nbytes} bytes exceeds the cache cap, not caching it')
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic(), candidates)
+            self._total_bytes += candidates.nbytes
+            while len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _remove(self, key: str):
+        _, candidates = self._entries.pop(key)
+        self._total_bytes -= candidates.nbytes
@@ -84,7 +84,7 @@ def is_frame_in_csv(frame_id: str, file_name: str) -> bool:
         return any(row[0] == video_id and int(row[1]) == frame_idx for row in reader)
 
 
-def get_file_contents(file_name: str) -> Dict:
+async def get_file_contents(file_name: str) -> Dict:
     file_path = os.path.join(Config.RESULTS_DIR, file_name)
     existing_frames = []
     frame_ids = set()
@@ -96,14 +96,14 @@ def get_file_contents(file_name: str) -> Dict:
             for row in reader:
                 frame_id = f'{row[0]}_{int(row[1]):06d}'
                 frame_id_extra = f'{row[0]}_extra_{int(row[1]):06d}'
-                frame = frame_data_manager.get_frame_by_key(
-                    frame_id) or frame_data_manager.get_frame_by_key(frame_id_extra)
+                frame = await frame_data_manager.get_frame_by_key(
+                    frame_id) or await frame_data_manager.get_frame_by_key(frame_id_extra)
                 logger.info(f'frame_id: {frame_id} - frame_id_extra: {frame_id_extra} - frame: {frame}')
                 if frame:
                     existing_frames.append(frame)
                     frame_ids.add(frame_id)
 
-    frames_to_add = [frame for frame in frame_data_manager.get_selected_frames(
+    frames_to_add = [frame for frame in await frame_data_manager.get_selected_frames(
     ) if frame.id not in frame_ids]
     limit_exceeded = len(existing_frames) + \
         len(frames_to_add) > Config.MAX_FRAMES_PER_FILE
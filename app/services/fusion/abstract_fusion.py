@@ -1,9 +1,32 @@
 from abc import ABC, abstractmethod
-from typing import Dict
-from app.models import SearchResult, FrameMetadataModel, QueriesStructure
+from typing import Dict, Tuple
+import numpy as np
+from app.models import SearchResult, FrameMetadataModel, QueriesStructure, Score
+from app.utils.data_manager.frame_data_manager import frame_data_manager
 
 
 class AbstractFusion(ABC):
     @abstractmethod
     def merge_results(self, searcher_results: Dict[str, SearchResult], queries: QueriesStructure) -> Dict[str, FrameMetadataModel]:
         pass
+
+    def fuse(self, stages: Dict[str, Tuple[np.ndarray, np.ndarray]], queries: QueriesStructure) -> Tuple[np.ndarray, np.ndarray]:
+        """Fuse ``(frame_indices, scores)`` rankings per searcher into one ranking, best first.
+
+        Builds the frame models ``merge_results`` needs; fusions that only
+        look at ranks and scores should override this and skip them.
+        """
+        searcher_results = {}
+        for name, (indices, scores) in stages.items():
+            frames = []
+            for index, score in zip(np.asarray(indices).tolist(), np.asarray(scores).tolist()):
+                frame = frame_data_manager.store.build_frame(index)
+                frame.score = Score(value=score)
+                frames.append(frame)
+            searcher_results[name] = SearchResult(
+                frames=frames, total=len(frames), page=1, has_more=False)
+
+        merged = sorted(self.merge_results(searcher_results, queries).values(),
+                        key=lambda frame: frame.final_score, reverse=True)
+        return (frame_data_manager.store.indices_of([frame.id for frame in merged]),
+                np.array([frame.final_score for frame in merged], dtype=np.float64))
@@ -1,6 +1,7 @@
 from .abstract_fusion import AbstractFusion
 from app.models import SearchResult, FrameMetadataModel, Score, QueriesStructure
-from typing import Dict, List
+from typing import Dict, Tuple
+import numpy as np
 from app.log import logger
 from app.utils.weight_normalizer import WeightNormalizer
 
@@ -8,31 +9,49 @@ logger = logger.getChild(__name__)
 
 
 class SimpleFusion(AbstractFusion):
+    base_k = 60
+
     def merge_results(self, searcher_results: Dict[str, SearchResult], queries: QueriesStructure) -> Dict[str, FrameMetadataModel]:
-        merged = self._collect_frames(searcher_results)
+        stages = {
+            searcher_name: (np.array([frame.id for frame in result.frames]),
+                            np.array([frame.score.value if frame.score else 0.0 for frame in result.frames]))
+            for searcher_name, result in searcher_results.items()
+        }
+        frame_ids, scores = self.fuse(stages, queries)
+
+        # Only the fused frames are copied, and shallowly.
+        first_frames = {}
+        for result in searcher_results.values():
+            for frame in result.frames:
+                first_frames.setdefault(frame.id, frame)
+        return {
+            frame_id: first_frames[frame_id].model_copy(update={
+                'score': Score(value=float(score), details={}), 'final_score': float(score)})
+            for frame_id, score in zip(frame_ids.tolist(), scores.tolist())
+        }
 
-        if not merged:
+    def fuse(self, stages: Dict[str, Tuple[np.ndarray, np.ndarray]], queries: QueriesStructure) -> Tuple[np.ndarray, np.ndarray]:
+        """Weighted reciprocal rank plus score over the stages, min-max normalized.
+
+        ``stages`` maps a searcher name to its ``(frame ids, scores)``, best
+        first. Returns the fused ids and scores, best first, with ties in the
+        order the frames first appear across the stages.
+        """
+        stages = {name: (np.asarray(ids), np.asarray(scores, dtype=np.float64))
+                  for name, (ids, scores) in stages.items()}
+        all_ids = [ids for ids, _ in stages.values() if len(ids)]
+        if not all_ids:
             logger.warning("No results to merge.")
-            return {}
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
 
+        frame_ids, first_seen = np.unique(np.concatenate(all_ids), return_index=True)
         weights = self._calculate_weights(queries)
-        self._calculate_scores(merged, weights)
-        self._normalize_scores(merged)
-        return merged
+        fused = self._calculate_scores(frame_ids, stages, weights)
+        fused = self._normalize_scores(fused)
 
-    def _collect_frames(self, searcher_results: Dict[str, SearchResult]) -> Dict[str, FrameMetadataModel]:
-        merged = {}
-        for searcher_name, result in searcher_results.items():
-            for rank, frame in enumerate(result.frames, start=1):
-                idx = frame.keyframe.frame_index
-                if idx not in merged:
-                    merged[idx] = frame.model_copy(deep=True)
-                    merged[idx].score = Score(value=0.0, details={})
-                merged[idx].score.details[searcher_name] = {
-                    'rank': rank,
-                    'score': frame.score.value if frame.score else 0.0
-                }
-        return merged
+        order = np.argsort(first_seen, kind='stable')
+        order = order[np.argsort(-fused[order], kind='stable')]
+        return frame_ids[order], fused[order]
 
     def _calculate_weights(self, queries: QueriesStructure) -> Dict[str, float]:
         weights = {
@@ -42,33 +61,18 @@ class SimpleFusion(AbstractFusion):
         }
         return WeightNormalizer.normalize(weights)
 
-    def _calculate_scores(self, merged: Dict[str, FrameMetadataModel], weights: Dict[str, float]):
-        base_k = 60
-        for frame in merged.values():
-            rrf_score = sum(
-                weights[searcher] *
-                (1 / (base_k + details['rank']) + details['score'])
-                for searcher, details in frame.score.details.items()
-                if weights.get(searcher, 0) > 0
-            )
-            frame.score.value = rrf_score
-
-    def _normalize_scores(self, merged: Dict[str, FrameMetadataModel]):
-        if not merged:
-            logger.warning("No frames to normalize scores.")
-            return
-
-        scores = [frame.score.value for frame in merged.values()]
-        min_score = min(scores)
-        max_score = max(scores)
+    def _calculate_scores(self, frame_ids: np.ndarray, stages: Dict[str, Tuple[np.ndarray, np.ndarray]], weights: Dict[str, float]) -> np.ndarray:
+        fused = np.zeros(len(frame_ids), dtype=np.float64)
+        for searcher, (ids, scores) in stages.items():
+            weight = weights.get(searcher, 0)
+            if weight <= 0 or not len(ids):
+                continue
+            ranks = np.arange(1, len(ids) + 1)
+            fused[np.searchsorted(frame_ids, ids)] += weight * (1 / (self.base_k + ranks) + scores)
+        return fused
 
+    def _normalize_scores(self, scores: np.ndarray) -> np.ndarray:
+        min_score, max_score = scores.min(), scores.max()
         if max_score > min_score:
-            for frame in merged.values():
-                frame.score.value = (frame.score.value -
-                                     min_score) / (max_score - min_score)
-        else:
-            for frame in merged.values():
-                frame.score.value = 1.0
-
-        for frame in merged.values():
-            frame.final_score = frame.score.value
+            return (scores - min_score) / (max_score - min_score)
+        return np.ones_like(scores)
@@ -1,5 +1,6 @@
 import redis
-from typing import Set, Dict, Any, List
+import redis.asyncio as aioredis
+from typing import Iterable, Optional, Set, Dict, Any, List, Tuple
 
 from config import Config
 
@@ -46,6 +47,24 @@ class RedisService:
         """Check if a value is a member of a Redis set."""
         return self.client.sismember(key, value)
 
+    def get_membership_and_scores(self, set_key: str, zset_key: str, members: Iterable[Any]) -> Tuple[List[bool], List[Optional[float]]]:
+        """Check set membership and sorted-set scores of many members in one pipelined round-trip."""
+        members = list(members)
+        if not members:
+            return [], []
+
+        pipe = self.client.pipeline(transaction=False)
+        for member in members:
+            pipe.sismember(set_key, member)
+        for member in members:
+            pipe.zscore(zset_key, member)
+        results = pipe.execute()
+
+        memberships = [bool(result) for result in results[:len(members)]]
+        scores = [float(score) if score is not None else None
+                  for score in results[len(members):]]
+        return memberships, scores
+
     def zadd(self, key: str, mapping: Dict[Any, float]):
         """Add one or more members to a sorted set, or update its score if it already exists."""
         self.client.zadd(key, mapping)
@@ -97,4 +116,95 @@ class RedisService:
             return value
 
 
+class AsyncRedisService:
+    """asyncio counterpart of ``RedisService`` for use inside request handlers.
+
+    Connections come from a bounded pool; when every connection is busy a
+    caller waits up to ``pool_timeout`` seconds instead of opening more.
+    """
+
+    def __init__(self,
+                 max_connections: int = Config.REDIS_MAX_CONNECTIONS,
+                 socket_timeout: float = Config.REDIS_SOCKET_TIMEOUT,
+                 pool_timeout: float = Config.REDIS_POOL_TIMEOUT):
+        self.pool = aioredis.BlockingConnectionPool(
+            host=Config.REDIS_HOST,
+            port=Config.REDIS_PORT,
+            db=Config.REDIS_DB,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout,
+        )
+        self.client = aioredis.Redis(connection_pool=self.pool)
+
+    def pipeline(self, transaction: bool = False) -> aioredis.client.Pipeline:
+        """Create a pipeline; queue commands on it and ``await pipe.execute()`` once."""
+        return self.client.pipeline(transaction=transaction)
+
+    async def add_to_set(self, key: str, value: Any):
+        """Add a value to a Redis set."""
+        await self.client.sadd(key, value)
+
+    async def remove_from_set(self, key: str, value: Any):
+        """Remove a value from a Redis set."""
+        await self.client.srem(key, value)
+
+    async def get_set_members(self, key: str) -> Set[Any]:
+        """Retrieve all members of a Redis set."""
+        return {self._decode_value(member) for member in await self.client.smembers(key)}
+
+    async def delete_key(self, *keys: str):
+        """Delete one or more keys from Redis."""
+        await self.client.delete(*keys)
+
+    async def is_member_of_set(self, key: str, value: Any) -> bool:
+        """Check if a value is a member of a Redis set."""
+        return bool(await self.client.sismember(key, value))
+
+    async def get_membership_and_scores(self, set_key: str, zset_key: str, members: Iterable[Any]) -> Tuple[List[bool], List[Optional[float]]]:
+        """Check set membership and sorted-set scores of many members in one pipelined round-trip."""
+        members = list(members)
+        if not members:
+            return [], []
+
+        pipe = self.pipeline()
+        for member in members:
+            pipe.sismember(set_key, member)
+        for member in members:
+            pipe.zscore(zset_key, member)
+        results = await pipe.execute()
+
+        memberships = [bool(result) for result in results[:len(members)]]
+        scores = [float(score) if score is not None else None
+                  for score in results[len(members):]]
+        return memberships, scores
+
+    async def zadd(self, key: str, mapping: Dict[Any, float]):
+        """Add one or more members to a sorted set, or update its score if it already exists."""
+        await self.client.zadd(key, mapping)
+
+    async def zrem(self, key: str, *values):
+        """Remove one or more members from a sorted set."""
+        await self.client.zrem(key, *values)
+
+    async def zscore(self, key: str, member: Any) -> Optional[float]:
+        """Get the score associated with the given member in a sorted set."""
+        score = await self.client.zscore(key, member)
+        return float(score) if score is not None else None
+
+    async def close(self):
+        """Close the client and disconnect every pooled connection."""
+        await self.client.aclose()
+        await self.pool.disconnect()
+
+    def _decode_value(self, value: Any) -> Any:
+        """Decode value from bytes to string, if possible."""
+        try:
+            return value.decode('utf-8')
+        except AttributeError:
+            return value
+
+
 redis_service = RedisService()
+async_redis_service = AsyncRedisService()
@@ -1,9 +1,26 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from app.models import FrameMetadataModel, ObjectQuery
+from app.utils.data_manager.frame_data_manager import frame_data_manager
 
 
 class AbstractReranker(ABC):
     @abstractmethod
     def rerank(self, merged_results: Dict[str, FrameMetadataModel], text_query: Optional[str], object_query: Optional[ObjectQuery]) -> List[FrameMetadataModel]:
         pass
+
+    def rerank_candidates(self, frame_indices: np.ndarray, scores: np.ndarray, text_query: Optional[str], object_query: Optional[ObjectQuery]) -> Tuple[np.ndarray, np.ndarray]:
+        """``rerank`` for fused frame indices and scores.
+
+        Builds the frame models ``rerank`` needs; rerankers that only look
+        at scores should override this and skip them.
+        """
+        merged = {}
+        for index, score in zip(frame_indices.tolist(), scores.tolist()):
+            frame = frame_data_manager.store.build_frame(index)
+            frame.final_score = score
+            merged[frame.id] = frame
+        reranked = self.rerank(merged, text_query, object_query)
+        return (frame_data_manager.store.indices_of([frame.id for frame in reranked]),
+                np.array([frame.final_score for frame in reranked], dtype=np.float64))
@@ -1,15 +1,20 @@
 import numpy as np
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from app.log import logger
-from app.utils.indexer import FaissIndexer
+from app.utils.embedding_store import EmbeddingStore, embedding_store_registry
+from app.utils.indexer import FaissIndexer, ShardedFaissIndexer
+from app.utils.knn_graph import KnnGraph
 
 logger = logger.getChild(__name__)
 
 
 class GlobalReranker:
-    def __init__(self, frame_data_manager, faiss_index: FaissIndexer):
+    def __init__(self, frame_data_manager, faiss_index: FaissIndexer, knn_graph: Optional[KnnGraph] = None, embedding_store: Optional[EmbeddingStore] = None):
         self.frame_data_manager = frame_data_manager
         self.faiss_index = faiss_index
+        self.knn_graph = knn_graph
+        self.embedding_store = embedding_store or embedding_store_registry.get(
+            faiss_index)
 
     def initial_retrieval(self, text_query_embedding: np.ndarray, num_initial_results: int = 1000) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         distances, frame_indices = self.faiss_index.search(
@@ -20,40 +25,57 @@ class GlobalReranker:
         valid_indices = frame_indices[0]
         valid_similarities = initial_similarities
 
-        # Retrieve embeddings directly from FAISS
-        initial_embeddings = self.get_embeddings_from_faiss(valid_indices)
+        initial_embeddings = self.get_embeddings(valid_indices)
 
         return valid_indices, valid_similarities, initial_embeddings
 
-    def get_embeddings_from_faiss(self, indices: np.ndarray) -> np.ndarray:
-        embeddings = np.empty(
-            (len(indices), self.faiss_index.index.d), dtype=np.float32)
-        for i, idx in enumerate(indices):
-            self.faiss_index.index.reconstruct(int(idx), embeddings[i])
-        return embeddings
-
-    def refine_embeddings(self, initial_embeddings: np.ndarray, num_neighbors: int = 5, similarity_weight: float = 0.15) -> np.ndarray:
-        refined_embeddings = []
-        for embedding in initial_embeddings:
-            neighbor_distances, neighbor_indices = self.faiss_index.search(
-                embedding.reshape(1, -1), num_neighbors)
-            neighbor_similarities = 1 / (1 + neighbor_distances[0])
-            neighbor_embeddings = self.get_embeddings_from_faiss(
-                neighbor_indices[0])
-            refined_embedding = self.weighted_average_pooling(
-                neighbor_embeddings, neighbor_similarities, similarity_weight)
-            refined_embeddings.append(refined_embedding)
-        return np.array(refined_embeddings)
-
-    def weighted_average_pooling(self, embeddings: np.ndarray, similarities: np.ndarray, similarity_weight: float = 0.15) -> np.ndarray:
+    def get_embeddings(self, indices: np.ndarray) -> np.ndarray:
+        return self.embedding_store.get(indices)
+
+    def refine_embeddings(self, initial_embeddings: np.ndarray, num_neighbors: int = 5, similarity_weight: float = 0.15, frame_indices: Optional[np.ndarray] = None) -> np.ndarray:
+        if len(initial_embeddings) == 0:
+            return np.empty((0, self.faiss_index.d), dtype=np.float32)
+
+        neighbor_distances, neighbor_indices = self.find_neighbors(
+            initial_embeddings, num_neighbors, frame_indices)
+        neighbor_similarities = 1 / (1 + neighbor_distances)
+
+        # FAISS pads missing neighbours with -1; give them zero weight.
+        found = neighbor_indices >= 0
+        neighbor_embeddings = self.get_embeddings(
+            np.where(found, neighbor_indices, 0)).reshape(*neighbor_indices.shape, -1)
+        return self.weighted_average_pooling(
+            neighbor_embeddings, neighbor_similarities, similarity_weight, mask=found)
+
+    def find_neighbors(self, embeddings: np.ndarray, num_neighbors: int, frame_indices: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Look keyframe neighbours up in the kNN graph when possible, else search the index."""
+        if self.knn_graph is not None and frame_indices is not None \
+                and num_neighbors <= self.knn_graph.k and np.all(frame_indices >= 0):
+            similarities, neighbor_ids = self.knn_graph.neighbors(frame_indices, num_neighbors)
+            if isinstance(self.faiss_index, ShardedFaissIndexer):
+                # The graph spans every shard; drop neighbours in unloaded
+                # ones like FAISS padding, and search the loaded shards when
+                # a keyframe has none left.
+                loaded = self.faiss_index.loaded_mask()
+                found = (neighbor_ids >= 0) & loaded[np.maximum(neighbor_ids, 0)]
+                if not np.all(found.any(axis=1)):
+                    return self.faiss_index.search_batch(embeddings, num_neighbors)
+                neighbor_ids = np.where(found, neighbor_ids, -1)
+            return similarities, neighbor_ids
+        return self.faiss_index.search_batch(embeddings, num_neighbors)
+
+    def weighted_average_pooling(self, embeddings: np.ndarray, similarities: np.ndarray, similarity_weight: float = 0.15, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Pool the neighbour axis (second to last) of ``embeddings``, weighting each by ``similarity ** similarity_weight``."""
         weights = similarities ** similarity_weight
-        weighted_sum = np.sum(embeddings * weights[:, np.newaxis], axis=0)
-        return weighted_sum / np.sum(weights)
+        if mask is not None:
+            weights = np.where(mask, weights, 0)
+        weighted_sum = np.sum(embeddings * weights[..., np.newaxis], axis=-2)
+        return weighted_sum / np.sum(weights, axis=-1, keepdims=True)
 
     def expand_query(self, text_query_embedding: np.ndarray, num_neighbors: int = 5) -> np.ndarray:
         _, query_neighbor_indices = self.faiss_index.search(
             text_query_embedding.reshape(1, -1), num_neighbors)
-        query_neighbor_embeddings = self.get_embeddings_from_faiss(
+        query_neighbor_embeddings = self.get_embeddings(
             query_neighbor_indices[0])
         return np.max(query_neighbor_embeddings, axis=0)
 
@@ -75,7 +97,7 @@ class GlobalReranker:
 
         # Refine embeddings
         refined_embeddings = self.refine_embeddings(
-            initial_embeddings, num_neighbors, similarity_weight)
+            initial_embeddings, num_neighbors, similarity_weight, frame_indices=initial_frame_indices)
 
         # Expand query
         expanded_query = self.expand_query(
@@ -91,9 +113,9 @@ class GlobalReranker:
         # Get frame IDs and scores
         reranked_results = []
         for idx in reranked_indices:
-            frame = self.frame_data_manager.get_frame_by_index(
+            frame_id = self.frame_data_manager.get_frame_key(
                 int(initial_frame_indices[idx]))
-            if frame:
-                reranked_results.append((frame.id, float(final_scores[idx])))
+            if frame_id:
+                reranked_results.append((frame_id, float(final_scores[idx])))
 
         return reranked_results
@@ -1,8 +1,13 @@
 from .abstract_reranker import AbstractReranker
 from app.models import FrameMetadataModel, ObjectQuery
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 
 
 class SimpleReranker(AbstractReranker):
     def rerank(self, merged_results: Dict[str, FrameMetadataModel], text_query: Optional[str], object_query: Optional[ObjectQuery]) -> List[FrameMetadataModel]:
         return sorted(merged_results.values(), key=lambda x: x.final_score, reverse=True)
+
+    def rerank_candidates(self, frame_indices: np.ndarray, scores: np.ndarray, text_query: Optional[str], object_query: Optional[ObjectQuery]) -> Tuple[np.ndarray, np.ndarray]:
+        # Fusion already returns candidates in stable descending score order.
+        return frame_indices, scores
@@ -0,0 +1,126 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple
+import httpx
+import numpy as np
+from app.models import QueriesStructure, RankedCandidates, ShardRankRequest, ShardRankResponse, StageRanking
+from app.services.candidate_cache import CandidateCache
+from app.services.fusion.simple_fusion import SimpleFusion
+from app.services.search_service import SearchService
+from app.services.searcher.tag_searcher import TagSearcher
+from app.services.searcher.text_searcher import TextSearcher
+from app.utils.query_vectorizer.tag_vectorizer import resolve_terms
+from app.utils.query_vectorizer.text_vectorizer import TextQueryVectorizer
+from app.utils.search_processor import TextProcessor
+from app.log import logger
+from config import Config
+
+logger = logger.getChild(__name__)
+
+
+class SearchCoordinator(SearchService):
+    """Scatter-gather ``SearchService`` over shard worker processes.
+
+    The coordinator embeds the text query and resolves tag terms once, sends
+    the prepared query to every worker in ``shard_urls`` (``app.shard_server``),
+    merges each stage's rankings into a global top ``candidate_depth`` and
+    fuses the stages. Only the requested page is hydrated, from the local
+    frame store; the CLIP index lives in the workers.
+    """
+
+    def __init__(self,
+                 shard_urls: List[str],
+                 text_vectorizer: TextQueryVectorizer,
+                 text_processor: TextProcessor,
+                 tags_list: List[str],
+                 candidate_cache: Optional[CandidateCache] = None,
+                 candidate_depth: int = Config.SEARCH_CANDIDATE_DEPTH,
+                 timeout: float = Config.SEARCH_SHARD_TIMEOUT_SECONDS,
+                 ):
+        super().__init__(None, None, None, SimpleFusion(), None,
+                         candidate_cache=candidate_cache, candidate_depth=candidate_depth)
+        self.shard_urls = [url.rstrip('/') for url in shard_urls]
+        self.text_vectorizer = text_vectorizer
+        self.text_processor = text_processor
+        self.tags_list = tags_list
+        self.client = httpx.AsyncClient(timeout=timeout)
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def _rank_candidates(self, queries: QueriesStructure, boost_factors: Optional[Dict[str, float]] = None) -> RankedCandidates:
+        request = await self._prepare_request(queries, boost_factors)
+        responses, failed = await self._scatter(request)
+
+        stage_names = {name for response in responses for name in response.stages}
+        stages = {name: self._merge_stage(name, [response.stages[name] for response in responses
+                                                 if name in response.stages])
+                  for name in sorted(stage_names)}
+
+        frame_indices, scores = self.fusion.fuse(stages, queries)
+        # A ranking missing a shard is reported like a timed-out stage, so
+        # it is not cached either.
+        return RankedCandidates(
+            frame_indices=frame_indices.astype(np.int64), scores=scores.astype(np.float32),
+            completed_stages=tuple(stages), timed_out_stages=tuple(failed))
+
+    async def _prepare_request(self, queries: QueriesStructure, boost_factors: Optional[Dict[str, float]]) -> ShardRankRequest:
+        text_vector, search_params = None, {}
+        if queries.text_searcher:
+            text_query = queries.text_searcher.query
+            text_vector = np.asarray(await self.text_vectorizer.vectorize(text_query.query)).reshape(-1).tolist()
+            search_params = text_query.search_params()
+
+        tag_terms = None
+        if queries.tag_searcher:
+            tag_terms = await resolve_terms(self.text_processor, self.tags_list, queries.tag_searcher.query)
+
+        return ShardRankRequest(
+            text_vector=text_vector,
+            text_search_params=search_params,
+            tag_terms=tag_terms,
+            object_query=queries.object_detection_searcher.query if queries.object_detection_searcher else None,
+            filters=queries.filters,
+            depth=self.candidate_depth,
+            boost_factors=boost_factors,
+        )
+
+    async def _scatter(self, request: ShardRankRequest) -> Tuple[List[ShardRankResponse], List[str]]:
+        payload = request.model_dump(mode='json')
+        results = await asyncio.gather(*(
+            self._rank_on_shard(url, payload) for url in self.shard_urls), return_exceptions=True)
+
+        responses, failed = [], []
+        for url, result in zip(self.shard_urls, results):
+            if isinstance(result, httpx.HTTPError):
+                logger.error(f"Shard worker {url} failed: {result}")
+                failed.append(f'shard {url}')
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                responses.append(result)
+        if not responses:
+            raise RuntimeError(f'No shard worker answered: {failed}')
+        return responses, failed
+
+    async def _rank_on_shard(self, url: str, payload: Dict) -> ShardRankResponse:
+        response = await self.client.post(f'{url}/rank', json=payload)
+        response.raise_for_status()
+        return ShardRankResponse(**response.json())
+
+    def _merge_stage(self, name: str, rankings: List[StageRanking]) -> Tuple[np.ndarray, np.ndarray]:
+        """Global top ``candidate_depth`` of one stage; the workers' frame sets are disjoint.
+
+        Every worker score grows with the match (text sends raw inner
+        products), so the merge keeps the highest scores.
+        """
+        indices = np.concatenate([np.asarray(ranking.frame_indices, dtype=np.int64) for ranking in rankings])
+        scores = np.concatenate([np.asarray(ranking.scores, dtype=np.float32) for ranking in rankings])
+        order = np.argsort(-scores, kind='stable')[:self.candidate_depth]
+        indices, scores = indices[order], scores[order]
+        if name == 'text':
+            # Same stage ranking and scores as a single-node search.
+            indices, scores = TextSearcher.stage_ranking(indices, scores)
+        elif name == 'tag':
+            # Workers return boosted scores; normalize over the merged list.
+            scores = TagSearcher.normalize_scores(scores)
+        return indices, scores
@@ -1,12 +1,17 @@
 import asyncio
-from typing import List, Optional, Dict
-from app.models import SearchResult, FrameMetadataModel, QueriesStructure, TextQuery
+from typing import Any, Coroutine, List, Optional, Dict, Tuple
+import numpy as np
+from app.models import RankedCandidates, SearchResult, FrameMetadataModel, QueriesStructure, TagQuery, TextQuery
+from app.services.candidate_cache import CandidateCache
 from app.services.searcher.object_detection_searcher import ObjectDetectionSearcher
 from app.services.searcher.tag_searcher import TagSearcher
 from app.services.searcher.text_searcher import TextSearcher
 from app.services.fusion.abstract_fusion import AbstractFusion
 from app.services.reranker.abstract_reranker import AbstractReranker
+from app.utils.data_manager.frame_data_manager import frame_data_manager
+from app.utils.stage_executor import stage_executor
 from app.log import logger
+from config import Config
 
 logger = logger.getChild(__name__)
 
@@ -18,12 +23,19 @@ class SearchService:
                  tag_searcher: TagSearcher,
                  fusion: AbstractFusion,
                  reranker: AbstractReranker,
+                 candidate_cache: Optional[CandidateCache] = None,
+                 candidate_depth: int = Config.SEARCH_CANDIDATE_DEPTH,
+                 stage_deadlines: Optional[Dict[str, float]] = None,
                  ):
         self.text_searcher = text_searcher
         self.tag_searcher = tag_searcher
         self.object_detection_searcher = object_detection_searcher
         self.fusion = fusion
         self.reranker = reranker
+        self.candidate_cache = candidate_cache
+        self.candidate_depth = candidate_depth
+        self.stage_deadlines = {**Config.SEARCH_STAGE_DEADLINES,
+                                **(stage_deadlines or {})}
 
     async def search(self, queries: QueriesStructure, use_tag_inference: bool, page: int = 1, per_page: int = 20, boost_factors: Optional[Dict[str, float]] = None) -> SearchResult:
         try:
@@ -34,62 +46,131 @@ class SearchService:
                 logger.warning("No active queries provided.")
                 return SearchResult(frames=[], total=0, page=page, has_more=False)
 
-            search_tasks = []
-            searcher_results = {}
+            cache_key = self.candidate_cache.make_key(
+                queries, boost_factors) if self.candidate_cache else None
+            candidates = self.candidate_cache.get(
+                cache_key) if cache_key else None
 
-            if queries.text_searcher:
-                search_tasks.append(self.text_searcher.search(
-                    queries.text_searcher.query, page=page, per_page=page*per_page))
+            if candidates is None:
+                candidates = await self._rank_candidates(queries, boost_factors)
+                # A ranking that is missing a timed-out stage is not cached, so
+                # the next request gets another chance to run that stage.
+                if cache_key and not candidates.timed_out_stages:
+                    self.candidate_cache.put(cache_key, candidates)
+            else:
+                logger.info(f"Serving page {page} from cached candidates")
 
-            if queries.tag_searcher:
-                search_tasks.append(self.tag_searcher.search(
-                    queries.tag_searcher.query, page=page, per_page=page*per_page, boost_factors=boost_factors))
-
-            if queries.object_detection_searcher:
-                search_tasks.append(self.object_detection_searcher.search(
-                    queries.object_detection_searcher.query, page=page, per_page=page*per_page))
-
-            results = await asyncio.gather(*search_tasks)
-
-            if queries.text_searcher:
-                searcher_results['text'] = results.pop(0)
-
-            if queries.tag_searcher:
-                searcher_results['tag'] = results.pop(0)
-
-            if queries.object_detection_searcher:
-                searcher_results['object'] = results.pop(0)
-
-            logger.debug(f'Found: {searcher_results}')
-
-            merged_results = self.fusion.merge_results(
-                searcher_results, queries)
-
-            text_query = queries.text_searcher.query if queries.text_searcher else None
-            object_query = queries.object_detection_searcher.query if queries.object_detection_searcher else None
-            final_results = self.reranker.rerank(
-                merged_results, text_query, object_query)
-
-            paginated_results = self._paginate_results(
-                final_results, page, per_page)
+            paginated_results = await self._paginate_results(
+                candidates, page, per_page)
 
             logger.info(
-                f"Search completed. Total results: {len(final_results)}, Current page: {page}")
+                f"Search completed. Total results: {candidates.size}, Current page: {page}")
             return paginated_results
         except Exception as e:
             logger.error(
                 f"Error occurred during search: {str(e)}", exc_info=True)
             raise
 
-    def _paginate_results(self, sorted_results: List[FrameMetadataModel], page: int, per_page: int) -> SearchResult:
-        total_results = len(sorted_results)
+    async def _rank_candidates(self, queries: QueriesStructure, boost_factors: Optional[Dict[str, float]] = None) -> RankedCandidates:
+        stages = {}
+        depth = self.candidate_depth
+
+        # Filters are applied inside each searcher, so every stage still
+        # returns up to ``depth`` frames that pass them.
+        id_mask = frame_data_manager.store.filter_mask(queries.filters)
+        if id_mask is not None and not id_mask.any():
+            logger.info(f"No frames match filters {queries.filters}")
+            return RankedCandidates.empty()
+
+        # Every stage ranks up to ``depth`` candidate ids; fusion and
+        # reranking run once over their union and only the requested page
+        # is built afterwards.
+        if queries.text_searcher:
+            stages['text'] = self._rank_text(
+                queries.text_searcher.query, depth, id_mask)
+
+        if queries.tag_searcher:
+            stages['tag'] = self._rank_tags(
+                queries.tag_searcher.query, depth, boost_factors, id_mask)
+
+        if queries.object_detection_searcher:
+            stages['object'] = self.object_detection_searcher.rank(
+                queries.object_detection_searcher.query, depth, id_mask)
+
+        stage_rankings, timed_out = await self._run_stages(stages)
+
+        logger.debug(
+            f'Found: { {name: len(indices) for name, (indices, _) in stage_rankings.items()} }')
+
+        frame_indices, scores = await stage_executor.run(
+            self._fuse_and_rerank, stage_rankings, queries)
+
+        return RankedCandidates(
+            frame_indices=frame_indices.astype(np.int64), scores=scores.astype(np.float32),
+            completed_stages=tuple(stage_rankings), timed_out_stages=tuple(timed_out))
+
+    async def _rank_text(self, query: TextQuery, depth: int, id_mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        query_vector = await self.text_searcher.vectorizer.vectorize(query.query)
+        indices, inner_products = await self.text_searcher.rank(query_vector, depth, query.search_params(), id_mask)
+        # Best match first, so it gets the best reciprocal rank in fusion.
+        return TextSearcher.stage_ranking(indices, inner_products)
+
+    async def _rank_tags(self, query: TagQuery, depth: int, boost_factors: Optional[Dict[str, float]], id_mask: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        query_vector, _ = await self.tag_searcher.vectorizer.vectorize(query)
+        indices, scores = await self.tag_searcher.rank(query_vector, depth, boost_factors, id_mask)
+        return indices, TagSearcher.normalize_scores(scores)
+
+    async def _run_stages(self, stages: Dict[str, Coroutine[Any, Any, Tuple[np.ndarray, np.ndarray]]]) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], List[str]]:
+        """Run searcher stages concurrently, each bounded by its deadline.
+
+        Stages that miss their deadline are dropped from the fusion and
+        reported as timed out; any other error is raised as before.
+        """
+        names = list(stages)
+        results = await asyncio.gather(*(
+            asyncio.wait_for(stages[name], timeout=self.stage_deadlines.get(name))
+            for name in names), return_exceptions=True)
+
+        searcher_results = {}
+        timed_out = []
+        for name, result in zip(names, results):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning(
+                    f"{name} search missed its {self.stage_deadlines.get(name)}s deadline")
+                timed_out.append(name)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                searcher_results[name] = result
+        return searcher_results, timed_out
+
+    def _fuse_and_rerank(self, stage_rankings: Dict[str, Tuple[np.ndarray, np.ndarray]], queries: QueriesStructure) -> Tuple[np.ndarray, np.ndarray]:
+        frame_indices, scores = self.fusion.fuse(stage_rankings, queries)
+
+        text_query = queries.text_searcher.query if queries.text_searcher else None
+        object_query = queries.object_detection_searcher.query if queries.object_detection_searcher else None
+        return self.reranker.rerank_candidates(
+            frame_indices, scores, text_query, object_query)
+
+    async def _paginate_results(self, candidates: RankedCandidates, page: int, per_page: int) -> SearchResult:
+        total_results = candidates.size
         start_idx = (page - 1) * per_page
         end_idx = start_idx + per_page
-        paged_frames = sorted_results[start_idx:end_idx]
+        page_indices = candidates.frame_indices[start_idx:end_idx]
+        page_scores = candidates.scores[start_idx:end_idx]
+
+        paged_frames: List[FrameMetadataModel] = []
+        frames = await frame_data_manager.get_frames_by_indices(page_indices)
+        for frame, score in zip(frames, page_scores):
+            if frame:
+                frame.final_score = float(score)
+                paged_frames.append(frame)
 
         return SearchResult(
             frames=paged_frames,
             total=total_results,
             page=page,
-            has_more=end_idx < total_results
+            has_more=end_idx < total_results,
+            completed_stages=list(candidates.completed_stages),
+            timed_out_stages=list(candidates.timed_out_stages)
         )
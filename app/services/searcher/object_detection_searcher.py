@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 import numpy as np
 from scipy.sparse import csr_matrix
 from app.log import logger
@@ -6,6 +6,7 @@ from app.services.searcher.abstract_searcher import AbstractSearcher
 from app.models import FrameMetadataModel, ObjectQuery, Score, SearchResult
 from app.utils.data_manager.frame_data_manager import frame_data_manager
 from app.utils.query_vectorizer.object_detection_vectorizer import ObjectQueryVectorizer
+from app.utils.stage_executor import stage_executor
 
 logger = logger.getChild(__name__)
 
@@ -14,17 +15,17 @@ class ObjectDetectionSearcher(AbstractSearcher):
     def __init__(self, vectorizer: ObjectQueryVectorizer):
         self.vectorizer = vectorizer
 
-    async def search(self, query: ObjectQuery, page: int, per_page: int) -> SearchResult:
+    async def search(self, query: ObjectQuery, page: int, per_page: int, id_mask: Optional[np.ndarray] = None) -> SearchResult:
         logger.info(f"Performing object detection search with query: {query}")
 
-        similar_frames = await self.search_similar_frames(query, top_k=per_page*page + 50)
+        similar_frames = await self.search_similar_frames(query, top_k=per_page*page + 50, id_mask=id_mask)
         if not similar_frames:
             logger.warning("No similar frames found for the given query.")
             return SearchResult(frames=[], total=0, page=page, has_more=False)
 
         sorted_results = sorted(similar_frames,
                                 key=lambda x: x['similarity'], reverse=True)
-        result_frames = self.prepare_result_frames(
+        result_frames = await self.prepare_result_frames(
             sorted_results, page, per_page)
 
         total_results = len(sorted_results)
@@ -37,25 +38,26 @@ class ObjectDetectionSearcher(AbstractSearcher):
             has_more=len(result_frames) == per_page
         )
 
-    async def search_similar_frames(self, query: ObjectQuery, top_k: int = 5) -> List[Dict[str, float]]:
-        query_vector = self.vectorizer.vectorize(query)
-        similarities, indices = self.vectorizer.search(query_vector, k=top_k)
-        logger.debug(
-            f"Search results - similarities: {similarities}, indices: {indices}")
-
-        results = []
-        for idx in indices:
-            if similarities[idx] <= 0:
-                continue
+    async def search_similar_frames(self, query: ObjectQuery, top_k: int = 5, id_mask: Optional[np.ndarray] = None) -> List[Dict[str, float]]:
+        indices, similarities = await self.rank(query, top_k, id_mask)
+        return [{'frame_index': int(idx), 'similarity': float(similarity)}
+                for idx, similarity in zip(indices, similarities)]
 
-            results.append({
-                'frame_index': int(idx),
-                'similarity': float(similarities[idx])
-            })
+    async def rank(self, query: ObjectQuery, top_k: int, id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """``(frame_indices, similarities)`` of the ``top_k`` matching frames, best first."""
+        id_mask = await stage_executor.run(self.vectorizer.match_mask, query, id_mask)
+        if id_mask is not None and not id_mask.any():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
 
-        return results
+        query_vector = await stage_executor.run(self.vectorizer.vectorize, query)
+        similarities, indices = await stage_executor.run(
+            self.vectorizer.search, query_vector, k=top_k, id_mask=id_mask,
+            spatial_tolerance=query.spatial_tolerance)
+        logger.debug(
+            f"Search results - similarities: {similarities}, indices: {indices}")
+        return indices, similarities
     
-    def prepare_result_frames(self, sorted_results: List[Dict[str, float]], page: int, per_page: int) -> List[FrameMetadataModel]:
+    async def prepare_result_frames(self, sorted_results: List[Dict[str, float]], page: int, per_page: int) -> List[FrameMetadataModel]:
         start = (page - 1) * per_page
         end = start + per_page
 
@@ -64,15 +66,17 @@ class ObjectDetectionSearcher(AbstractSearcher):
         start = (page - 1) * per_page
         end = start + per_page
 
+        page_results = sorted_results[start:end]
+        frames = await frame_data_manager.get_frames_by_indices(
+            [result['frame_index'] for result in page_results])
+
         result_frames: List[FrameMetadataModel] = []
-        for result in sorted_results[start:end]:
-            frame = frame_data_manager.get_frame_by_index(
-                result['frame_index'])
+        for result, frame in zip(page_results, frames):
             if frame:
                 frame.score = Score(value=float(result['similarity']), details={
                                     'object': float(result['similarity'])})
                 result_frames.append(frame)
             else:
-                logger.warning(f"Frame not found for id: {result['frame_id']}")
+                logger.warning(f"Frame not found for index: {result['frame_index']}")
 
         return result_frames
@@ -4,6 +4,7 @@ from app.services.searcher.abstract_searcher import AbstractSearcher
 from app.models import Score, SearchResult, FrameMetadataModel, TagQuery
 from app.utils.data_manager.frame_data_manager import frame_data_manager
 from app.utils.query_vectorizer.tag_vectorizer import TagQueryVectorizer
+from app.utils.stage_executor import stage_executor
 from app.log import logger
 
 logger = logger.getChild(__name__)
@@ -13,25 +14,25 @@ class TagSearcher(AbstractSearcher):
     def __init__(self, vectorizer: TagQueryVectorizer):
         self.vectorizer = vectorizer
 
-    async def search(self, query: TagQuery, page: int, per_page: int, boost_factors: Optional[Dict[str, float]] = None) -> SearchResult:
+    async def search(self, query: TagQuery, page: int, per_page: int, boost_factors: Optional[Dict[str, float]] = None, id_mask: Optional[np.ndarray] = None) -> SearchResult:
         logger.info(
             f"Performing tag search with query: {query.query}, additional entities: {query.entities}")
 
         query_vector, terms = await self.vectorizer.vectorize(query)
-        similar_frames = await self.search_similar_frames(query_vector, top_k=per_page*page + 50)
+        similarities, indices = await stage_executor.run(
+            self.vectorizer.search, query_vector, k=per_page*page + 50, id_mask=id_mask)
 
-        if not similar_frames:
+        if not len(indices):
             logger.warning("No similar frames found for the given query.")
             return SearchResult(frames=[], total=0, page=page, has_more=False)
 
-        self.apply_boost_and_normalize(similar_frames, boost_factors)
+        boosts = self.boost_array(indices, boost_factors)
+        final_scores = self.normalize_scores(similarities * boosts)
+        order = np.argsort(-final_scores, kind='stable')
+        result_frames = await self.prepare_result_frames(
+            indices[order], similarities[order], boosts[order], final_scores[order], page, per_page)
 
-        sorted_results = sorted(
-            similar_frames, key=lambda x: x['final_score'], reverse=True)
-        result_frames = self.prepare_result_frames(
-            sorted_results, page, per_page)
-
-        total_results = len(sorted_results)
+        total_results = len(indices)
         logger.debug(f"Retrieved {total_results} frames")
 
         return SearchResult(
@@ -41,53 +42,63 @@ class TagSearcher(AbstractSearcher):
             has_more=len(result_frames) == per_page
         )
 
-    async def search_similar_frames(self, query_vector: np.ndarray, top_k: int = 5) -> List[Dict[str, float]]:
-        similarities, indices = self.vectorizer.search(query_vector, k=top_k)
-
-        results = []
-        for idx in indices:
-            if similarities[idx] <= 0:
-                continue
-
-            frame_id = frame_data_manager.index_to_frame_key.get(int(idx))
-            if frame_id:
-                results.append({
-                    'frame_id': frame_id,
-                    'similarity': float(similarities[idx])
-                })
-            else:
-                logger.warning(f"No frame_id found for index {idx}")
-
-        return results
-
-    def apply_boost_and_normalize(self, frames: List[Dict[str, float]], boost_factors: Optional[Dict[str, float]] = None):
-        if boost_factors is None:
-            boost_factors = {frame['frame_id']: 1.0 for frame in frames}
-
-        for frame in frames:
-            frame['boost'] = boost_factors.get(frame['frame_id'], 1.0)
-            frame['final_score'] = frame['similarity'] * frame['boost']
-
-        total_score = sum(frame['final_score'] for frame in frames)
-        if total_score > 1.0:
-            normalization_factor = 1.0 / total_score
-            for frame in frames:
-                frame['final_score'] *= normalization_factor
-
-    def prepare_result_frames(self, sorted_results: List[Dict[str, float]], page: int, per_page: int) -> List[FrameMetadataModel]:
+    async def rank(self, query_vector: np.ndarray, top_k: int, boost_factors: Optional[Dict[str, float]] = None, id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """``(frame_indices, boosted_similarities)`` of the ``top_k`` matching frames, best first.
+
+        Scores are not normalized yet; see ``normalize_scores``.
+        """
+        similarities, indices = await stage_executor.run(
+            self.vectorizer.search, query_vector, k=top_k, id_mask=id_mask)
+        scores = (similarities * self.boost_array(indices, boost_factors)).astype(np.float32)
+        if boost_factors:
+            order = np.argsort(-scores, kind='stable')
+            indices, scores = indices[order], scores[order]
+        return indices.astype(np.int64), scores
+
+    @staticmethod
+    def boost_array(indices: np.ndarray, boost_factors: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """Boost of each frame index, from ``boost_factors`` keyed by frame key (1 when absent)."""
+        boosts = np.ones(len(indices), dtype=np.float32)
+        if not boost_factors:
+            return boosts
+
+        boosted = frame_data_manager.store.indices_of(boost_factors.keys())
+        factors = np.fromiter(boost_factors.values(), dtype=np.float32, count=len(boost_factors))
+        known = boosted >= 0
+        boosted, factors = boosted[known], factors[known]
+        if not len(boosted):
+            return boosts
+
+        order = np.argsort(boosted)
+        boosted, factors = boosted[order], factors[order]
+        slots = np.minimum(np.searchsorted(boosted, indices), len(boosted) - 1)
+        hits = boosted[slots] == indices
+        boosts[hits] = factors[slots[hits]]
+        return boosts
+
+    @staticmethod
+    def normalize_scores(scores: np.ndarray) -> np.ndarray:
+        """Scale scores to sum to 1 when their total exceeds 1."""
+        total_score = float(scores.sum())
+        return scores / total_score if total_score > 1.0 else scores
+
+    async def prepare_result_frames(self, indices: np.ndarray, similarities: np.ndarray, boosts: np.ndarray,
+                                    final_scores: np.ndarray, page: int, per_page: int) -> List[FrameMetadataModel]:
         start = (page - 1) * per_page
         end = start + per_page
 
+        frames = await frame_data_manager.get_frames_by_indices(indices[start:end])
+
         result_frames = []
-        for result in sorted_results[start:end]:
-            frame = frame_data_manager.get_frame_by_key(result['frame_id'])
+        for index, similarity, boost, final_score, frame in zip(
+                indices[start:end], similarities[start:end], boosts[start:end], final_scores[start:end], frames):
             if frame:
-                frame.score = Score(value=float(result['final_score']), details={
-                    'tag': float(result['similarity']),
-                    'boost': float(result['boost'])
+                frame.score = Score(value=float(final_score), details={
+                    'tag': float(similarity),
+                    'boost': float(boost)
                 })
                 result_frames.append(frame)
             else:
-                logger.warning(f"Frame not found for id: {result['frame_id']}")
+                logger.warning(f"Frame not found for index: {index}")
 
         return result_frames
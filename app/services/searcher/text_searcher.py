@@ -3,20 +3,27 @@ from app.services.searcher.abstract_searcher import AbstractSearcher
 from app.models import Score, SearchResult, FrameMetadataModel, TextQuery
 from app.utils.data_manager.frame_data_manager import frame_data_manager
 from app.utils.query_vectorizer.text_vectorizer import TextQueryVectorizer
-from typing import List
+from app.utils.stage_executor import stage_executor
+from typing import Dict, List, Optional, Tuple
 from app.log import logger
+from config import Config
 
 logger = logger.getChild(__name__)
 
 
 class TextSearcher(AbstractSearcher):
-    def __init__(self, vectorizer: TextQueryVectorizer):
+    def __init__(self, vectorizer: TextQueryVectorizer, rescore_depth: int = Config.TEXT_RESCORE_DEPTH):
         self.vectorizer = vectorizer
+        self.rescore_depth = rescore_depth
+        if rescore_depth and not vectorizer.embedding_store.memory_mapped:
+            logger.warning(
+                'Text re-scoring is on but there is no embedding matrix; re-scoring against reconstructed vectors')
 
-    async def search(self, query: TextQuery, page: int, per_page: int) -> SearchResult:
+    async def search(self, query: TextQuery, page: int, per_page: int, id_mask: Optional[np.ndarray] = None) -> SearchResult:
         logger.info(f"Performing text search with query: {query.query}")
 
-        similar_frames = await self.search_similar_frames(query.query, top_k=per_page*page + 50)
+        similar_frames = await self.search_similar_frames(
+            query.query, top_k=per_page*page + 50, search_params=query.search_params(), id_mask=id_mask)
 
         if not similar_frames:
             logger.warning("No similar frames found for the given query.")
@@ -28,10 +35,12 @@ class TextSearcher(AbstractSearcher):
         start = (page - 1) * per_page
         end = start + per_page
 
+        page_results = sorted_results[start:end]
+        frames = await frame_data_manager.get_frames_by_indices(
+            [result['frame_index'] for result in page_results])
+
         result_frames: List[FrameMetadataModel] = []
-        for result in sorted_results[start:end]:
-            frame = frame_data_manager.get_frame_by_index(
-                result['frame_index'])
+        for result, frame in zip(page_results, frames):
             if frame:
                 frame.score = Score(value=float(result['similarity']), details={
                                     'text': float(result['similarity'])})
@@ -47,25 +56,54 @@ class TextSearcher(AbstractSearcher):
             has_more=end < total_results
         )
 
-    async def search_similar_frames(self, query: str, top_k: int = 5) -> List[dict]:
+    async def search_similar_frames(self, query: str, top_k: int = 5, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> List[dict]:
         query_vector = await self.vectorizer.vectorize(query)
+        indices, inner_products = await self.rank(query_vector, top_k, search_params, id_mask)
+        similarities = self.similarities(inner_products)
 
-        distances, indices = self.vectorizer.search(query_vector, k=top_k)
-
-        if np.all(indices == -1):
+        if len(indices) == 0:
             logger.warning(
                 "All search indices are -1. This might indicate an issue with the index or the query vector.")
             return []
 
-        results = []
-        for idx, distance in zip(indices, distances):
-            if idx != -1:
-                similarity = 1 / (1 + distance)
-                results.append({
-                    'frame_index': int(idx),
-                    'similarity': float(similarity)
-                })
+        results = [{'frame_index': int(idx), 'similarity': float(similarity)}
+                   for idx, similarity in zip(indices, similarities)]
 
         logger.debug(f"Search results: {results}")
 
         return results
+
+    async def rank(self, query_vector: np.ndarray, top_k: int, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """``(frame_indices, inner_products)`` of the ``top_k`` frames for an embedded query, best first.
+
+        Scores are the raw inner products, so they decrease down the list
+        and rankings from several index shards merge by sorting on them.
+        ``similarities`` turns them into the score text results report.
+        """
+        distances, indices = await stage_executor.run(
+            self.candidate_search, query_vector, top_k, search_params, id_mask)
+        found = indices != -1
+        return indices[found].astype(np.int64), distances[found].astype(np.float32)
+
+    @staticmethod
+    def similarities(inner_products: np.ndarray) -> np.ndarray:
+        """``(1 + inner product) / 2``, the text score carried into results and fusion.
+
+        It grows with the inner product, so it keeps the best-first order of
+        ``rank``; for the normalized CLIP vectors it lies in ``[0, 1]``.
+        """
+        return ((1 + inner_products) / 2).astype(np.float32)
+
+    @classmethod
+    def stage_ranking(cls, indices: np.ndarray, inner_products: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """``rank`` output as the text stage enters fusion: ``(frame_indices, similarities)``, best match first."""
+        return indices, cls.similarities(inner_products)
+
+    def candidate_search(self, query_vector: np.ndarray, top_k: int, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the index directly, or take ``rescore_depth`` approximate candidates and re-score them exactly."""
+        if not self.rescore_depth or self.vectorizer.search_mode == 'binary' or self.vectorizer.scans_exactly(id_mask):
+            return self.vectorizer.search(query_vector, k=top_k, search_params=search_params, id_mask=id_mask)
+
+        _, candidate_indices = self.vectorizer.search(
+            query_vector, k=max(self.rescore_depth, top_k), search_params=search_params, id_mask=id_mask)
+        return self.vectorizer.rescore(query_vector, candidate_indices, top_k)
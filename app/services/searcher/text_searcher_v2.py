@@ -4,8 +4,11 @@ from app.services.searcher.abstract_searcher import AbstractSearcher
 from app.models import Score, SearchResult, FrameMetadataModel, TextQuery
 from app.utils.data_manager.frame_data_manager import frame_data_manager
 from app.utils.query_vectorizer.text_vectorizer import TextQueryVectorizer
+from app.utils.knn_graph import KnnGraph
+from app.utils.stage_executor import stage_executor
 from typing import Dict, List, Tuple
 from app.log import logger
+from config import Config
 
 logger = logger.getChild(__name__)
 
@@ -14,15 +17,17 @@ class TextSearcherV2(AbstractSearcher):
     def __init__(self, vectorizer: TextQueryVectorizer):
         self.vectorizer = vectorizer
         self.reranker = GlobalReranker(
-            frame_data_manager, vectorizer.faiss_index)
+            frame_data_manager, vectorizer.faiss_index,
+            knn_graph=KnnGraph.load(Config.KNN_GRAPH_DIR, vectorizer.faiss_index),
+            embedding_store=frame_data_manager.embedding_store)
 
     async def search(self, query: TextQuery, page: int, per_page: int) -> SearchResult:
         logger.info(f"Performing text search with query: {query.query}")
 
         query_embedding = await self.vectorizer.vectorize(query.query)
         num_initial_results = per_page * page + 100
-        reranked_results = self.reranker.rerank(
-            query_embedding, num_initial_results=num_initial_results)
+        reranked_results = await stage_executor.run(
+            self.reranker.rerank, query_embedding, num_initial_results=num_initial_results)
 
         if not reranked_results:
             logger.warning(
@@ -34,7 +39,7 @@ class TextSearcherV2(AbstractSearcher):
             logger.warning("No results found even after fallback")
             return SearchResult(frames=[], total=0, page=page, has_more=False)
 
-        paginated_frames: List[FrameMetadataModel] = self.prepare_result_frames(
+        paginated_frames: List[FrameMetadataModel] = await self.prepare_result_frames(
             reranked_results, page, per_page)
 
         total_results = len(reranked_results)
@@ -52,19 +57,22 @@ class TextSearcherV2(AbstractSearcher):
             query_embedding, k)
         results = []
         for idx, distance in zip(indices[0], distances[0]):
-            frame = frame_data_manager.get_frame_by_index(int(idx))
-            if frame:
+            frame_id = frame_data_manager.get_frame_key(int(idx))
+            if frame_id:
                 similarity = 1 / (1 + distance)
-                results.append((frame.id, float(similarity)))
+                results.append((frame_id, float(similarity)))
         return results
 
-    def prepare_result_frames(self, reranked_results: List[Tuple[str, float]], page: int, per_page: int) -> List[FrameMetadataModel]:
+    async def prepare_result_frames(self, reranked_results: List[Tuple[str, float]], page: int, per_page: int) -> List[FrameMetadataModel]:
         start = (page - 1) * per_page
         end = start + per_page
 
+        page_results = reranked_results[start:end]
+        frames = await frame_data_manager.get_frames_by_keys(
+            [frame_id for frame_id, _ in page_results])
+
         paginated_frames: List[FrameMetadataModel] = []
-        for frame_id, similarity_score in reranked_results[start:end]:
-            frame = frame_data_manager.get_frame_by_key(frame_id)
+        for (_, similarity_score), frame in zip(page_results, frames):
             if frame:
                 frame.score = Score(value=float(similarity_score), details={
                                     'text': float(similarity_score)})
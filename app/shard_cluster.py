@@ -0,0 +1,50 @@
+import argparse
+import subprocess
+import sys
+from typing import List
+from app.log import logger
+from app.utils.indexer import read_shard_manifest
+from config import Config
+
+logger = logger.getChild(__name__)
+
+
+def split_shards(shards: List[str], n_workers: int) -> List[List[str]]:
+    """Deal shards round-robin so every worker gets a similar number of batches."""
+    return [shards[i::n_workers] for i in range(n_workers) if shards[i::n_workers]]
+
+
+def launch_local_workers(n_workers: int, base_port: int, host: str = '127.0.0.1', shard_dir: str = Config.FAISS_SHARD_DIR):
+    """Start ``n_workers`` shard server processes on localhost and wait for them."""
+    manifest = read_shard_manifest(shard_dir)
+    if manifest is None:
+        raise SystemExit(f'No shard manifest in {shard_dir}; build shards first')
+
+    processes, urls = [], []
+    for i, shards in enumerate(split_shards(manifest['shards'], n_workers)):
+        port = base_port + i
+        processes.append(subprocess.Popen([
+            sys.executable, '-m', 'app.shard_server',
+            '--shards', *shards, '--host', host, '--port', str(port)]))
+        urls.append(f'http://{host}:{port}')
+        logger.info(f'Shard worker {urls[-1]} serves {shards}')
+
+    logger.info(
+        f"Run the app with SEARCH_SHARD_URLS={','.join(urls)} to coordinate these workers")
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run several shard workers on this machine, splitting the index shards between them.')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--base-port', type=int, default=8101)
+    parser.add_argument('--host', default='127.0.0.1')
+    args = parser.parse_args()
+
+    launch_local_workers(args.workers, args.base_port, args.host)
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+from typing import List, Optional
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from app.log import logger
+from app.models import ShardRankRequest, ShardRankResponse, StageRanking
+from app.services.searcher.object_detection_searcher import ObjectDetectionSearcher
+from app.services.searcher.tag_searcher import TagSearcher
+from app.services.searcher.text_searcher import TextSearcher
+from app.utils.data_manager.frame_data_manager import frame_data_manager
+from app.utils.data_manager.tag_manager import tags_list
+from app.utils.indexer import ShardedFaissIndexer
+from app.utils.object_bitmap_index import ObjectBitmapIndex
+from app.utils.query_vectorizer.object_detection_vectorizer import ObjectQueryVectorizer
+from app.utils.query_vectorizer.tag_vectorizer import TagQueryVectorizer
+from app.utils.query_vectorizer.text_vectorizer import TextQueryVectorizer
+from app.utils.stage_executor import stage_executor
+from config import Config
+
+logger = logger.getChild(__name__)
+
+
+class ShardWorker:
+    """Ranks prepared queries against the frames of a few index shards.
+
+    The worker owns ``shards`` of ``FAISS_SHARD_DIR`` and restricts the object
+    and tag searches to the frames of those shards, so a ``SearchCoordinator``
+    can merge the stage rankings of all workers without duplicates. The tag
+    and object postings and the object bitmaps only hold owned frames. The
+    memory-mapped frame store is still opened whole, for filters and boost
+    keys, though the worker never builds frame models from it. It never
+    embeds text.
+    """
+
+    def __init__(self, shards: List[str], shard_dir: str = Config.FAISS_SHARD_DIR):
+        self.indexer = ShardedFaissIndexer(shard_dir, shards=shards)
+        store = frame_data_manager.store
+        if len(store) != self.indexer.ntotal:
+            raise ValueError(
+                f'Frame store has {len(store)} frames but the shards index {self.indexer.ntotal} ids')
+        self.owned = np.zeros(len(store), dtype=bool)
+        for shard in self.indexer.shards.values():
+            self.owned[shard.ids] = True
+
+        self.text_searcher = TextSearcher(
+            TextQueryVectorizer(None, None, self.indexer))
+        self.tag_searcher = TagSearcher(
+            TagQueryVectorizer(None, tags_list, row_mask=self.owned))
+        self.object_detection_searcher = ObjectDetectionSearcher(ObjectQueryVectorizer(
+            ObjectBitmapIndex.from_store(store, row_mask=self.owned), row_mask=self.owned))
+        logger.info(
+            f'Shard worker owns {int(self.owned.sum())} frames in shards {self.indexer.shard_names}')
+
+    async def rank(self, request: ShardRankRequest) -> ShardRankResponse:
+        filter_mask = frame_data_manager.store.filter_mask(request.filters)
+        # The loaded shards only hold owned frames, so text only needs the
+        # request's filter; an owned mask would force an exact scan whenever
+        # FAISS cannot take an id selector.
+        id_mask = self.owned if filter_mask is None else self.owned & filter_mask
+
+        stages = {}
+        if request.text_vector is not None:
+            stages['text'] = self.text_searcher.rank(
+                np.asarray(request.text_vector, dtype=np.float32), request.depth,
+                request.text_search_params, filter_mask)
+        if request.tag_terms is not None:
+            stages['tag'] = self._rank_tags(
+                request.tag_terms, request.depth, request.boost_factors, id_mask)
+        if request.object_query is not None:
+            stages['object'] = self.object_detection_searcher.rank(
+                request.object_query, request.depth, id_mask)
+
+        results = await asyncio.gather(*stages.values())
+        return ShardRankResponse(stages={
+            name: StageRanking(frame_indices=indices.tolist(), scores=scores.tolist())
+            for name, (indices, scores) in zip(stages, results)})
+
+    async def _rank_tags(self, terms: List[str], depth: int, boost_factors, id_mask: np.ndarray):
+        query_vector = await stage_executor.run(
+            self.tag_searcher.vectorizer.transform_terms, terms)
+        return await self.tag_searcher.rank(query_vector, depth, boost_factors, id_mask)
+
+
+app = FastAPI()
+worker: Optional[ShardWorker] = None
+
+
+@app.get("/health")
+async def health():
+    return {"shards": worker.indexer.shard_names if worker else []}
+
+
+@app.post("/rank", response_model=ShardRankResponse)
+async def rank(request: ShardRankRequest):
+    if worker is None:
+        raise HTTPException(status_code=503, detail="Shard worker is not ready")
+    return await worker.rank(request)
+
+
+@app.on_event("shutdown")
+def shutdown_stage_executor():
+    stage_executor.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve stage rankings for some shards of the CLIP index to a search coordinator.')
+    parser.add_argument('--shards', nargs='+', required=True)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8101)
+    args = parser.parse_args()
+
+    worker = ShardWorker(args.shards)
+    uvicorn.run(app, host=args.host, port=args.port)
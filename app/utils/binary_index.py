@@ -0,0 +1,104 @@
+import argparse
+import os
+from typing import Optional, Tuple
+import faiss
+import numpy as np
+from app.log import logger
+from app.utils.embedding_store import EmbeddingStore, embedding_store_registry
+from app.utils.indexer import faiss_index_registry
+from config import Config
+
+logger = logger.getChild(__name__)
+
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """Pack the sign bit of every dimension, 8 dimensions per byte."""
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+
+class BinaryIndex:
+    """1-bit sign codes of every keyframe embedding, searched by Hamming distance.
+
+    Row ``i`` of the code matrix belongs to FAISS id ``i``. The ``faiss``
+    backend copies the codes into an ``IndexBinaryFlat``; the ``numpy``
+    backend scans the memory-mapped codes with XOR + popcount instead.
+    """
+
+    def __init__(self, codes: np.ndarray, backend: str = Config.BINARY_SEARCH_BACKEND, chunk_size: int = 262144):
+        if backend not in ('faiss', 'numpy'):
+            raise ValueError(f'Unknown binary search backend {backend!r}')
+        self.codes = codes
+        self.chunk_size = chunk_size
+        self.index = None
+        if backend == 'faiss':
+            self.index = faiss.IndexBinaryFlat(codes.shape[1] * 8)
+            self.index.add(np.ascontiguousarray(codes))
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def backend(self) -> str:
+        return 'numpy' if self.index is None else 'faiss'
+
+    @classmethod
+    def load(cls, codes_path: str = Config.CLIP_BINARY_CODES_PATH, backend: str = Config.BINARY_SEARCH_BACKEND) -> Optional['BinaryIndex']:
+        if not os.path.exists(codes_path):
+            logger.warning(f'No binary codes at {codes_path}')
+            return None
+        binary_index = cls(np.load(codes_path, mmap_mode='r'), backend)
+        logger.info(
+            f'Loaded {len(binary_index)} binary codes from {codes_path} ({binary_index.backend} backend)')
+        return binary_index
+
+    def search(self, query_vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(hamming_distances, ids)`` of the ``k`` nearest codes, nearest first."""
+        query_code = binarize(np.asarray(query_vector).reshape(1, -1))
+        k = min(k, len(self))
+        if k <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int64)
+        if self.index is not None:
+            distances, ids = self.index.search(query_code, k)
+            return distances[0], ids[0]
+        return self._numpy_search(query_code[0], k)
+
+    def _numpy_search(self, query_code: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        distances = np.empty(len(self), dtype=np.uint16)
+        for start in range(0, len(self), self.chunk_size):
+            chunk = np.bitwise_xor(self.codes[start:start + self.chunk_size], query_code)
+            distances[start:start + len(chunk)] = POPCOUNT[chunk].sum(axis=1, dtype=np.uint16)
+
+        ids = np.argpartition(distances, k - 1)[:k] if k < len(self) else np.arange(len(self))
+        order = np.argsort(distances[ids], kind='stable')
+        ids = ids[order]
+        return distances[ids].astype(np.int32), ids.astype(np.int64)
+
+
+def build_binary_codes(store: EmbeddingStore, codes_path: str, batch_size: int = 65536):
+    """Write the sign codes of every vector in ``store`` as an id-aligned ``uint8`` ``.npy`` matrix."""
+    tmp_path = f'{codes_path}.tmp-{os.getpid()}.npy'
+    codes = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.uint8, shape=(len(store), (store.dim + 7) // 8))
+    for start in range(0, len(store), batch_size):
+        count = min(batch_size, len(store) - start)
+        codes[start:start + count] = binarize(store.get_range(start, count))
+        logger.info(f'Binarized {start + count}/{len(store)} embeddings')
+    codes.flush()
+    del codes
+    os.replace(tmp_path, codes_path)
+    logger.info(f'Saved binary codes to {codes_path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the 1-bit sign codes of the CLIP keyframe embeddings used by the binary search mode.')
+    parser.add_argument('--index', default=Config.FAISS_FLAT_BIN_PATH)
+    parser.add_argument('--embeddings', default=Config.CLIP_EMBEDDINGS_PATH)
+    parser.add_argument('--output', default=Config.CLIP_BINARY_CODES_PATH)
+    args = parser.parse_args()
+
+    store = embedding_store_registry.get(
+        faiss_index_registry.get(args.index), args.embeddings)
+    build_binary_codes(store, args.output)
@@ -0,0 +1,237 @@
+import argparse
+import csv
+import hashlib
+import json
+import os
+import shutil
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.log import logger
+from app.models import KeyframeInfo, Tag
+from config import Config
+from .frame_store import FrameStore, FrameStoreBuilder
+from .tag_manager import TagManager
+from .visual_encoding_manager import VisualEncodingManager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logger.getChild(__name__)
+
+# Bump whenever the layout of the columns or the way they are derived changes.
+SNAPSHOT_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+
+
+class FrameSnapshotManager:
+    """Builds ``FrameStore`` from the metadata JSON files and caches it on disk.
+
+    The snapshot is a directory of ``.npy`` columns plus a manifest recording
+    the snapshot version and the size, mtime and sha256 of every source file.
+    Workers memory-map the columns, so they share the same page-cache pages
+    and skip JSON parsing and validation entirely.
+    """
+
+    def __init__(self, snapshot_dir: str = Config.FRAME_SNAPSHOT_DIR, metadata_dir: str = Config.METADATA_DIR):
+        self.snapshot_dir = snapshot_dir
+        self.sources = {
+            'keyframes': os.path.join(metadata_dir, 'keyframes_metadata.json'),
+            'object_detection': os.path.join(metadata_dir, 'object_extraction_metadata.json'),
+            'tag': os.path.join(metadata_dir, 'tag_metadata.json'),
+            'classes': os.path.join(Config.OD_ENCODED_DIR, 'classes.csv'),
+        }
+
+    def load_or_build(self) -> FrameStore:
+        store = self.load()
+        if store is not None:
+            return store
+
+        with self._build_lock():
+            # Another worker may have rebuilt it while we were waiting.
+            store = self.load()
+            if store is not None:
+                return store
+            self.save(self.build_store())
+
+        store = self.load()
+        if store is None:
+            raise RuntimeError(
+                f'Frame snapshot at {self.snapshot_dir} is unreadable right after building it')
+        return store
+
+    def load(self) -> Optional[FrameStore]:
+        manifest = self._read_manifest()
+        if manifest is None:
+            logger.info(f'No frame snapshot found at {self.snapshot_dir}')
+            return None
+        if manifest.get('version') != SNAPSHOT_VERSION:
+            logger.info(
+                f"Frame snapshot version {manifest.get('version')} != {SNAPSHOT_VERSION}, rebuilding")
+            return None
+        if not self._sources_unchanged(manifest):
+            return None
+
+        arrays = {name: self._load_column(name)
+                  for name in FrameStore.COLUMNS}
+        logger.info(
+            f"Loaded frame snapshot from {self.snapshot_dir} ({manifest['frames']} frames)")
+        return FrameStore(arrays)
+
+    def save(self, store: FrameStore):
+        tmp_dir = f'{self.snapshot_dir}.tmp-{os.getpid()}'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in FrameStore.COLUMNS:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'),
+                    store.arrays[name], allow_pickle=False)
+
+        manifest = {
+            'version': SNAPSHOT_VERSION,
+            'frames': len(store),
+            'sources': {name: self._fingerprint(path) for name, path in self.sources.items()},
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w') as f:
+            json.dump(manifest, f, indent=2)
+
+        old_dir = f'{self.snapshot_dir}.old-{os.getpid()}'
+        if os.path.exists(self.snapshot_dir):
+            os.replace(self.snapshot_dir, old_dir)
+        os.replace(tmp_dir, self.snapshot_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+        logger.info(f'Saved frame snapshot to {self.snapshot_dir}')
+
+    def build_store(self) -> FrameStore:
+        logger.info('Building frame store from metadata JSON files')
+        classes = self._load_classes(self.sources['classes'])
+        tag_manager = TagManager()
+
+        keyframes_data, object_detection_data, tag_data = self._load_json_data()
+        builder = FrameStoreBuilder(VisualEncodingManager(classes))
+        for frame_key, frame_info in keyframes_data.items():
+            keyframe, raw_objects, tag = self._process_frame(
+                frame_key, frame_info, object_detection_data, tag_data, tag_manager)
+            builder.add_frame(frame_key, keyframe, raw_objects, tag)
+
+        return builder.build()
+
+    def _load_classes(self, csv_path: str) -> List[str]:
+        with open(csv_path, 'r') as f:
+            reader = csv.reader(f)
+            next(reader)  # Skip header
+            return [row[0] for row in reader]
+
+    def _load_json_data(self) -> Tuple[Dict, Dict, Dict]:
+        with open(self.sources['keyframes'], 'r') as f:
+            keyframes_data = json.load(f)
+        with open(self.sources['object_detection'], 'r') as f:
+            object_detection_data = json.load(f)
+        with open(self.sources['tag'], 'r') as f:
+            tag_data = json.load(f)
+        return keyframes_data, object_detection_data, tag_data
+
+    def _process_frame(self, frame_key: str, frame_info: Dict, object_detection_data: Dict, tag_data: Dict,
+                       tag_manager: TagManager) -> Tuple[KeyframeInfo, Dict[str, List[Dict]], Tag]:
+        keyframe = KeyframeInfo(**frame_info)
+        od_info = object_detection_data.get(f"{frame_key}_detection") or {}
+        raw_objects = od_info.get('objects') or {}
+        tag = tag_manager.process_tagging(frame_key, tag_data)
+        logger.debug(f'Frame loaded: {frame_key}')
+        return keyframe, raw_objects, tag
+
+    def _load_column(self, name: str) -> np.ndarray:
+        path = os.path.join(self.snapshot_dir, f'{name}.npy')
+        try:
+            return np.load(path, mmap_mode='r', allow_pickle=False)
+        except ValueError:
+            # Empty columns cannot be memory-mapped on every numpy version.
+            return np.load(path, allow_pickle=False)
+
+    def _read_manifest(self) -> Optional[Dict]:
+        path = os.path.join(self.snapshot_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Invalid frame snapshot manifest {path}: {e}')
+            return None
+
+    def _sources_unchanged(self, manifest: Dict) -> bool:
+        recorded = manifest.get('sources', {})
+        refreshed = {}
+        for name, path in self.sources.items():
+            previous = recorded.get(name)
+            if previous is None:
+                logger.info(f'Frame snapshot has no fingerprint for {name}')
+                return False
+            if not os.path.exists(path):
+                logger.warning(
+                    f'{path} is missing, trusting the frame snapshot as is')
+                refreshed[name] = previous
+                continue
+            stat = os.stat(path)
+            if stat.st_size == previous['size'] and stat.st_mtime_ns == previous['mtime_ns']:
+                refreshed[name] = previous
+                continue
+
+            current = self._fingerprint(path)
+            if current['sha256'] != previous['sha256']:
+                logger.info(f'{path} changed since the frame snapshot was built')
+                return False
+            refreshed[name] = current
+
+        if refreshed != recorded:
+            # Contents are identical but the files were touched; record the new
+            # mtimes so the next start does not hash them again.
+            self._write_manifest({**manifest, 'sources': refreshed})
+        return True
+
+    def _write_manifest(self, manifest: Dict):
+        path = os.path.join(self.snapshot_dir, MANIFEST_NAME)
+        tmp_path = f'{path}.tmp-{os.getpid()}'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f'Could not update frame snapshot manifest: {e}')
+
+    def _fingerprint(self, path: str) -> Dict:
+        stat = os.stat(path)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+    @contextmanager
+    def _build_lock(self):
+        os.makedirs(os.path.dirname(self.snapshot_dir) or '.', exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.snapshot_dir}.lock', 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the binary frame metadata snapshot loaded by the app at startup.')
+    parser.add_argument('--snapshot-dir', default=Config.FRAME_SNAPSHOT_DIR)
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild even if the snapshot is up to date')
+    args = parser.parse_args()
+
+    manager = FrameSnapshotManager(snapshot_dir=args.snapshot_dir)
+    if args.force or manager.load() is None:
+        manager.save(manager.build_store())
+    else:
+        logger.info(f'Frame snapshot at {args.snapshot_dir} is up to date')
@@ -0,0 +1,234 @@
+from array import array
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from app.log import logger
+from app.models import (Category, FrameMetadataModel, KeyframeInfo, ObjectDetection,
+                        ObjectDetectionItem, Score, SearchFilter, Tag)
+from .visual_encoding_manager import VisualEncodingManager
+
+logger = logger.getChild(__name__)
+
+CATEGORIES: List[Category] = list(Category)
+CATEGORY_TO_ID: Dict[Category, int] = {
+    category: i for i, category in enumerate(CATEGORIES)}
+
+
+def get_video_id(frame_key: str) -> str:
+    return '_'.join(frame_key.split('_')[:2])
+
+
+def get_batch_id(video_id: str) -> str:
+    return video_id.split('_')[0]
+
+
+class FrameStore:
+    """Columnar keyframe metadata.
+
+    Every per-frame attribute is a NumPy column indexed by the frame index
+    (the FAISS id). Detections and tags are packed into flat arrays and
+    addressed through ``*_offsets`` so that frame ``i`` owns the slice
+    ``offsets[i]:offsets[i + 1]``. ``FrameMetadataModel`` objects are only
+    built on demand.
+    """
+
+    COLUMNS = (
+        'keys', 'key_order', 'frame_paths', 'video_ids', 'videos',
+        'shot_index', 'frame_index', 'shot_start', 'shot_end',
+        'timestamp', 'width', 'height',
+        'det_offsets', 'det_category', 'det_score', 'det_box', 'det_token', 'tokens',
+        'tag_offsets', 'tag_ids', 'tags',
+    )
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        missing = [name for name in self.COLUMNS if name not in arrays]
+        if missing:
+            raise ValueError(f'Missing frame store columns: {missing}')
+        self.arrays = arrays
+        for name in self.COLUMNS:
+            setattr(self, name, arrays[name])
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, frame_key: str) -> bool:
+        return self.index_of(frame_key) is not None
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def key_at(self, index: int) -> Optional[str]:
+        if 0 <= index < len(self.keys):
+            return self.keys[index].decode('utf-8')
+        return None
+
+    def index_of(self, frame_key: str) -> Optional[int]:
+        indices = self.indices_of([frame_key])
+        return int(indices[0]) if indices[0] >= 0 else None
+
+    def indices_of(self, frame_keys: Iterable[str]) -> np.ndarray:
+        """Map frame keys to frame indices, ``-1`` for unknown keys."""
+        encoded = np.array([key.encode('utf-8') for key in frame_keys], dtype='S')
+        if len(encoded) == 0 or len(self.keys) == 0:
+            return np.full(len(encoded), -1, dtype=np.int64)
+
+        positions = np.searchsorted(
+            self.keys, encoded, sorter=self.key_order)
+        positions = np.minimum(positions, len(self.keys) - 1)
+        indices = self.key_order[positions].astype(np.int64)
+        indices[self.keys[indices] != encoded] = -1
+        return indices
+
+    def filter_mask(self, search_filter: Optional[SearchFilter]) -> Optional[np.ndarray]:
+        """Boolean mask over frame indices of the frames ``search_filter`` keeps; ``None`` keeps all."""
+        if search_filter is None or search_filter.is_empty():
+            return None
+
+        mask = np.ones(len(self), dtype=bool)
+        if search_filter.video_ids or search_filter.batches:
+            videos = [str(video) for video in self.videos]
+            allowed_videos = np.isin(videos, search_filter.video_ids) | np.isin(
+                [get_batch_id(video) for video in videos], search_filter.batches)
+            mask &= allowed_videos[self.video_ids]
+        if search_filter.min_timestamp is not None:
+            mask &= self.timestamp >= search_filter.min_timestamp
+        if search_filter.max_timestamp is not None:
+            mask &= self.timestamp <= search_filter.max_timestamp
+        return mask
+
+    def build_frame(self, index: int) -> FrameMetadataModel:
+        keyframe = KeyframeInfo.model_construct(
+            shot_index=int(self.shot_index[index]),
+            frame_index=int(self.frame_index[index]),
+            shot_start=int(self.shot_start[index]),
+            shot_end=int(self.shot_end[index]),
+            timestamp=float(self.timestamp[index]),
+            frame_path=self.frame_paths[index].decode('utf-8'),
+            width=int(self.width[index]),
+            height=int(self.height[index]),
+        )
+        return FrameMetadataModel.model_construct(
+            id=self.keys[index].decode('utf-8'),
+            keyframe=keyframe,
+            detection=self._build_detection(index),
+            tag=self._build_tag(index),
+            score=Score(),
+            selected=False,
+        )
+
+    def _build_detection(self, index: int) -> ObjectDetection:
+        start, end = self.det_offsets[index], self.det_offsets[index + 1]
+        objects: Dict[Category, List[ObjectDetectionItem]] = {}
+        encoded_detection = []
+        for i in range(start, end):
+            category = CATEGORIES[self.det_category[i]]
+            token = str(self.tokens[self.det_token[i]])
+            objects.setdefault(category, []).append(ObjectDetectionItem.model_construct(
+                score=float(self.det_score[i]),
+                box=self.det_box[i].tolist(),
+                encoded_bbox=token,
+            ))
+            encoded_detection.append(token)
+
+        counts = {category: len(items) for category, items in objects.items()}
+        return ObjectDetection.model_construct(
+            objects=objects, counts=counts, encoded_detection=' '.join(encoded_detection))
+
+    def _build_tag(self, index: int) -> Tag:
+        start, end = self.tag_offsets[index], self.tag_offsets[index + 1]
+        return Tag.model_construct(taggers=[str(self.tags[i]) for i in self.tag_ids[start:end]])
+
+
+class FrameStoreBuilder:
+    """Accumulates frames and packs them into a ``FrameStore``.
+
+    Raw detections of the whole dataset are buffered and grid-encoded in a
+    single batch when the store is built.
+    """
+
+    def __init__(self, visual_encoding_manager: VisualEncodingManager):
+        self.visual_encoding_manager = visual_encoding_manager
+        self.keys: List[bytes] = []
+        self.frame_paths: List[bytes] = []
+        self.video_ids: List[int] = []
+        self.videos: Dict[str, int] = {}
+        self.keyframe_columns: Dict[str, list] = {
+            name: [] for name in ('shot_index', 'frame_index', 'shot_start', 'shot_end', 'timestamp', 'width', 'height')}
+
+        self.det_offsets: List[int] = [0]
+        self.det_category = array('h')
+        self.det_score = array('f')
+        self.det_box = array('d')
+        self.det_frame_width = array('d')
+        self.det_frame_height = array('d')
+
+        self.tag_offsets: List[int] = [0]
+        self.tag_ids: List[int] = []
+        self.tags: Dict[str, int] = {}
+
+    def add_frame(self, frame_key: str, keyframe: KeyframeInfo, raw_objects: Dict[str, List[Dict]], tag: Optional[Tag]):
+        """Add a frame; ``raw_objects`` maps a label to its ``{'score', 'box'}`` pixel detections."""
+        self.keys.append(frame_key.encode('utf-8'))
+        self.frame_paths.append(keyframe.frame_path.encode('utf-8'))
+        video_id = get_video_id(frame_key)
+        self.video_ids.append(self.videos.setdefault(video_id, len(self.videos)))
+        for name, column in self.keyframe_columns.items():
+            column.append(getattr(keyframe, name))
+
+        for label, items in raw_objects.items():
+            category_id = CATEGORY_TO_ID[Category(label.lower())]
+            for item in items:
+                self.det_category.append(category_id)
+                self.det_score.append(item['score'])
+                self.det_box.extend(item['box'])
+                self.det_frame_width.append(keyframe.width)
+                self.det_frame_height.append(keyframe.height)
+        self.det_offsets.append(len(self.det_category))
+
+        if tag:
+            self.tag_ids.extend(self._intern(self.tags, tagger)
+                                for tagger in tag.taggers)
+        self.tag_offsets.append(len(self.tag_ids))
+
+    def _intern(self, table: Dict[str, int], value: str) -> int:
+        return table.setdefault(value, len(table))
+
+    def _table(self, table: Dict[str, int]) -> np.ndarray:
+        return np.array(list(table), dtype=str)
+
+    def build(self) -> FrameStore:
+        det_box, det_token, tokens = self.visual_encoding_manager.encode_dataset(
+            np.frombuffer(self.det_box, dtype=np.float64).reshape(-1, 4),
+            np.frombuffer(self.det_frame_width, dtype=np.float64),
+            np.frombuffer(self.det_frame_height, dtype=np.float64),
+            np.frombuffer(self.det_category, dtype=np.int16),
+            [category.value for category in CATEGORIES])
+
+        keys = np.array(self.keys, dtype='S')
+        columns = self.keyframe_columns
+        arrays = {
+            'keys': keys,
+            'key_order': np.argsort(keys, kind='stable').astype(np.int64),
+            'frame_paths': np.array(self.frame_paths, dtype='S'),
+            'video_ids': np.array(self.video_ids, dtype=np.int32),
+            'videos': self._table(self.videos),
+            'shot_index': np.array(columns['shot_index'], dtype=np.int32),
+            'frame_index': np.array(columns['frame_index'], dtype=np.int32),
+            'shot_start': np.array(columns['shot_start'], dtype=np.int32),
+            'shot_end': np.array(columns['shot_end'], dtype=np.int32),
+            'timestamp': np.array(columns['timestamp'], dtype=np.float64),
+            'width': np.array(columns['width'], dtype=np.int32),
+            'height': np.array(columns['height'], dtype=np.int32),
+            'det_offsets': np.array(self.det_offsets, dtype=np.int64),
+            'det_category': np.frombuffer(self.det_category, dtype=np.int16).copy(),
+            'det_score': np.frombuffer(self.det_score, dtype=np.float32).copy(),
+            'det_box': det_box.astype(np.float32),
+            'det_token': det_token.astype(np.int32),
+            'tokens': np.array(tokens, dtype=str),
+            'tag_offsets': np.array(self.tag_offsets, dtype=np.int64),
+            'tag_ids': np.array(self.tag_ids, dtype=np.int32),
+            'tags': self._table(self.tags),
+        }
+        store = FrameStore(arrays)
+        logger.info(
+            f'Built frame store: {len(store)} frames, {len(store.det_category)} detections, {len(store.tag_ids)} tags, {store.nbytes() / 1e6:.1f} MB')
+        return store
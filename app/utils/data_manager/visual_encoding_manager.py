@@ -1,4 +1,4 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import cv2
 import numpy as np
 from app.log import logger
@@ -11,32 +11,40 @@ class VisualEncodingManager:
         self.encoder = VisualEncoding(classes)
 
     def encode_bboxes(self, label: Category, bboxes_data: List[Dict], frame_width: int, frame_height: int) -> List[ObjectDetectionItem]:
-        bboxes = []
-        scores = []
-
-        for data in bboxes_data:
-            box = data['box']
-            normalized_box = [
-                box[0] / frame_width,
-                box[1] / frame_height,
-                box[2] / frame_width,
-                box[3] / frame_height
-            ]
-            bboxes.append(normalized_box)
-            scores.append(data['score'])
-
-
-        encoded_objects = []
-        for i, (bbox, score) in enumerate(zip(bboxes, scores)):
-            encoded_objects.append(ObjectDetectionItem(
-                score=score,
-                box=bbox,
-                encoded_bbox=self.encoder.encode_bboxes(
-                    np.array(bboxes), [str(label.value)])
-            ))
-
-        return encoded_objects
-
+        if not bboxes_data:
+            return []
+
+        bboxes = self.normalize_bboxes(
+            np.array([data['box'] for data in bboxes_data], dtype=np.float64),
+            np.full(len(bboxes_data), frame_width),
+            np.full(len(bboxes_data), frame_height))
+        encoded_bboxes = self.encoder.encode_bboxes(
+            bboxes, [str(label.value)] * len(bboxes)).split(' ')
+
+        return [
+            ObjectDetectionItem(score=data['score'], box=bbox.tolist(), encoded_bbox=encoded_bbox)
+            for data, bbox, encoded_bbox in zip(bboxes_data, bboxes, encoded_bboxes)
+        ]
+
+    def encode_dataset(self, bboxes: np.ndarray, frame_widths: np.ndarray, frame_heights: np.ndarray,
+                       label_ids: np.ndarray, label_names: List[str]) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """Encode every detection of the dataset at once.
+
+        ``bboxes`` is the ``(N, 4)`` array of raw pixel boxes and the other
+        arrays hold the frame size and label id of each box. Returns the
+        normalized boxes, the token id of each box and the token table, so
+        box ``i`` is encoded as ``tokens[token_ids[i]]``.
+        """
+        normalized = self.normalize_bboxes(bboxes, frame_widths, frame_heights)
+        token_ids, tokens = self.encoder.encode_grid_tokens(
+            normalized, label_ids, label_names)
+        return normalized, token_ids, tokens
+
+    @staticmethod
+    def normalize_bboxes(bboxes: np.ndarray, frame_widths: np.ndarray, frame_heights: np.ndarray) -> np.ndarray:
+        scale = np.stack([frame_widths, frame_heights,
+                         frame_widths, frame_heights], axis=1)
+        return bboxes.reshape(-1, 4) / scale
 
 
 class VisualEncoding:
@@ -60,6 +68,24 @@ class VisualEncoding:
 
         self.grid_bboxes = np.array(self.grid_bboxes)
 
+    def cell_distances(self) -> np.ndarray:
+        """``(cells, cells)`` Chebyshev distances between grid cells, in ``grid_labels`` order.
+
+        Cells sharing an edge or a corner are at distance 1.
+        """
+        rows, cols = np.divmod(np.arange(self.n_row * self.n_col), self.n_col)
+        return np.maximum(np.abs(rows[:, np.newaxis] - rows[np.newaxis, :]),
+                          np.abs(cols[:, np.newaxis] - cols[np.newaxis, :]))
+
+    def neighbour_cells(self, tolerance: int) -> Dict[str, List[Tuple[str, int]]]:
+        """``(label, distance)`` of the cells within ``tolerance`` of each cell, the cell itself included."""
+        distances = self.cell_distances()
+        return {
+            label: [(self.grid_labels[j], int(distances[i, j]))
+                    for j in np.flatnonzero(distances[i] <= tolerance)]
+            for i, label in enumerate(self.grid_labels)
+        }
+
     def visualize_grid(self, image):
         h, w = image.shape[:2]
         for i in range(self.n_row * self.n_col):
@@ -75,14 +101,42 @@ class VisualEncoding:
 
         return image
 
+    def assign_grid_cells(self, bboxes: np.ndarray, chunk_size: int = 16384) -> np.ndarray:
+        """Grid cell index of each ``(N, 4)`` normalized box, in one vectorized pass.
+
+        A box belongs to the cell whose top-left corner is closest to the box
+        centre. Rows are processed in chunks to bound the ``(N, cells)``
+        distance matrix.
+        """
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        centers = np.stack([(bboxes[:, 0] + bboxes[:, 2]) / 2,
+                           (bboxes[:, 1] + bboxes[:, 3]) / 2], axis=1)
+        corners = self.grid_bboxes[:, :2]
+
+        cells = np.empty(len(centers), dtype=np.int64)
+        for start in range(0, len(centers), chunk_size):
+            chunk = centers[start:start + chunk_size]
+            distances = np.sum(
+                (chunk[:, np.newaxis, :] - corners[np.newaxis, :, :])**2, axis=2)
+            cells[start:start + chunk_size] = np.argmin(distances, axis=1)
+        return cells
+
+    def encode_grid_tokens(self, bboxes: np.ndarray, label_ids: np.ndarray, label_names: List[str]) -> Tuple[np.ndarray, List[str]]:
+        """Encode boxes as ``<cell><label>`` tokens, returning token ids and the token table."""
+        cells = self.assign_grid_cells(bboxes)
+        pairs = cells * len(label_names) + np.asarray(label_ids, dtype=np.int64)
+        unique_pairs, token_ids = np.unique(pairs, return_inverse=True)
+        tokens = [
+            f"{self.grid_labels[pair // len(label_names)]}{label_names[pair % len(label_names)].replace(' ', '')}"
+            for pair in unique_pairs.tolist()
+        ]
+        return token_ids.reshape(-1), tokens
+
     def encode_bboxes(self, bboxes, labels):
-        context = []
-        for bbox, label in zip(bboxes, labels):
-            x, y = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
-            grid_idx = np.argmin(
-                np.sum((self.grid_bboxes[:, :2] - np.array([x, y]))**2, axis=1))
-            context.append(
-                f"{self.grid_labels[grid_idx]}{label.replace(' ', '')}")
+        bboxes = np.asarray(bboxes).reshape(-1, 4)[:len(labels)]
+        cells = self.assign_grid_cells(bboxes)
+        context = [f"{self.grid_labels[cell]}{label.replace(' ', '')}"
+                   for cell, label in zip(cells, labels)]
         return ' '.join(context)
 
     def encode_classes(self, labels):
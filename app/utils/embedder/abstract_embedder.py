@@ -1,17 +1,28 @@
 import numpy as np
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from abc import ABC, abstractmethod
 from sklearn.preprocessing import normalize
 from app.log import logger
+from app.utils.stage_executor import stage_executor
 
 logger = logger.getChild(__name__)
 
 
 class AbstractTextEmbedder(ABC):
+    model_name: str = ''
+
     @abstractmethod
     def embed(self, text: str) -> np.ndarray:
         pass
 
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([self.embed(text) for text in texts])
+
+    async def aembed(self, text: str) -> np.ndarray:
+        return await stage_executor.run(self.embed, text)
+
     def resize_embedding(self, embedding: np.ndarray, target_shape: Optional[Tuple[int, ...]]) -> np.ndarray:
         if target_shape is None or embedding.shape == target_shape:
             return embedding
@@ -0,0 +1,109 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+import numpy as np
+from app.log import logger
+from config import Config
+
+from .abstract_embedder import AbstractTextEmbedder
+
+logger = logger.getChild(__name__)
+
+
+class BatchingEmbedder(AbstractTextEmbedder):
+    """Coalesces concurrent embedding requests into batched ``embed_batch`` calls.
+
+    Each request is queued and answered through its own future. A worker
+    thread waits up to ``max_wait_ms`` after the first queued request for
+    more to arrive, then embeds up to ``max_batch_size`` texts in one
+    forward pass of the wrapped embedder.
+    """
+
+    def __init__(self,
+                 embedder: AbstractTextEmbedder,
+                 max_batch_size: int = Config.EMBEDDING_BATCH_MAX_SIZE,
+                 max_wait_ms: float = Config.EMBEDDING_BATCH_MAX_WAIT_MS):
+        self.embedder = embedder
+        self.model_name = embedder.model_name
+        self.feature_shape = getattr(embedder, 'feature_shape', None)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: 'queue.Queue[Optional[Tuple[str, Future]]]' = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(
+            target=self._run, name='embedding-batcher', daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        if self._closed:
+            raise RuntimeError('BatchingEmbedder is closed')
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> np.ndarray:
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return self.embedder.embed_batch([])
+        futures = [self.submit(text) for text in texts]
+        return np.stack([future.result() for future in futures])
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            batch = [request]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List[Tuple[str, Future]]):
+        batch = [(text, future) for text, future in batch
+                 if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        logger.debug(
+            f'Embedding batch of {len(texts)} texts for {len(batch)} requests')
+        try:
+            embeddings = self.embedder.embed_batch(texts)
+        except Exception as e:
+            logger.error(f'Batched embedding failed: {e}', exc_info=True)
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        embeddings_by_text = dict(zip(texts, embeddings))
+        for text, future in batch:
+            future.set_result(embeddings_by_text[text].copy())
@@ -0,0 +1,114 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from app.log import logger
+from config import Config
+
+logger = logger.getChild(__name__)
+
+
+class EmbeddingCache:
+    """LRU cache of query embeddings keyed by ``(model_name, query)``.
+
+    When ``persist_path`` is set the cache is loaded from that ``.npz`` file
+    on start and written back by ``save()``, so warm entries survive restarts.
+    """
+
+    def __init__(self, max_entries: int = Config.EMBEDDING_CACHE_MAX_ENTRIES, persist_path: Optional[str] = Config.EMBEDDING_CACHE_PATH):
+        self.max_entries = max_entries
+        self.persist_path = persist_path or None
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Tuple[str, str], np.ndarray]' = OrderedDict()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if self.persist_path:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model_name: str, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            embedding = self._entries.get((model_name, query))
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((model_name, query))
+            self.hits += 1
+            return embedding.copy()
+
+    def put(self, model_name: str, query: str, embedding: np.ndarray):
+        with self._lock:
+            self._entries[(model_name, query)] = np.array(
+                embedding, dtype=np.float32)
+            self._entries.move_to_end((model_name, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                model_names, queries, embeddings = data['model_names'], data['queries'], data['embeddings']
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(
+                f'Could not load embedding cache from {self.persist_path}: {e}')
+            return
+
+        with self._lock:
+            for model_name, query, embedding in zip(model_names, queries, embeddings):
+                self._entries[(str(model_name), str(query))] = embedding
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(
+            f'Loaded {len(self._entries)} cached embeddings from {self.persist_path}')
+
+    def save(self):
+        if not self.persist_path or not self._dirty:
+            return
+        with self._lock:
+            entries = list(self._entries.items())
+            self._dirty = False
+        if not entries:
+            return
+
+        # All embeddings of one file must share a dimension; keep the most
+        # recently used shape if the embedder changed underneath the cache.
+        shape = entries[-1][1].shape
+        entries = [(key, embedding)
+                   for key, embedding in entries if embedding.shape == shape]
+        tmp_path = f'{self.persist_path}.tmp-{os.getpid()}.npz'
+        try:
+            os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+            np.savez(tmp_path,
+                     model_names=np.array([key[0] for key, _ in entries], dtype=str),
+                     queries=np.array([key[1] for key, _ in entries], dtype=str),
+                     embeddings=np.stack([embedding for _, embedding in entries]))
+            os.replace(tmp_path, self.persist_path)
+            logger.info(
+                f'Saved {len(entries)} cached embeddings to {self.persist_path}')
+        except OSError as e:
+            logger.warning(
+                f'Could not save embedding cache to {self.persist_path}: {e}')
+
+
+embedding_cache = EmbeddingCache()
@@ -1,7 +1,7 @@
 import numpy as np
 import torch
 import faiss
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from open_clip import create_model_and_transforms, get_tokenizer
 from app.log import logger
 from app.utils.indexer import FaissIndexer
@@ -14,28 +14,31 @@ class OpenClipEmbedder(AbstractTextEmbedder):
     def __init__(self, model_name: str = 'ViT-L-14', pretrained: str = 'datacomp_xl_s13b_b90k', feature_shape: Optional[Tuple[int, ...]] = None):
         # self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.device = "cpu"
+        self.model_name = f'{model_name}/{pretrained}'
         self.model, _, _ = create_model_and_transforms(
             model_name, device=self.device, pretrained=pretrained)
         self.model.eval()
         self.tokenizer = get_tokenizer(model_name)
         self.feature_shape = feature_shape
 
-    @torch.no_grad()
     def embed(self, text: str) -> np.ndarray:
-        text_tokens = self.tokenizer([text]).to(self.device)
+        return self.embed_batch([text])[0]
+
+    @torch.no_grad()
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.feature_shape[0] if self.feature_shape else 0), dtype=np.float32)
+
+        text_tokens = self.tokenizer(texts).to(self.device)
         text_features = self.model.encode_text(text_tokens)
-        embedding = text_features.cpu().numpy()[0]
-        logger.debug(f"Raw embedding shape: {embedding.shape}")
-        logger.debug(f"Raw embedding: {embedding}")
-        
-        embedding = embedding.reshape(1, -1)
-        faiss.normalize_L2(embedding)
-        embedding = embedding.reshape(-1)
-        
-        resized_embedding = self.resize_embedding(
-            embedding, self.feature_shape)
-
-        logger.debug(f"Resized embedding shape: {resized_embedding.shape}")
-        logger.debug(f"Resized embedding: {resized_embedding}")
-
-        return resized_embedding
+        embeddings = np.ascontiguousarray(
+            text_features.cpu().numpy(), dtype=np.float32)
+        logger.debug(f"Raw embeddings shape: {embeddings.shape}")
+
+        faiss.normalize_L2(embeddings)
+
+        resized_embeddings = np.stack([
+            self.resize_embedding(embedding, self.feature_shape) for embedding in embeddings])
+        logger.debug(f"Resized embeddings shape: {resized_embeddings.shape}")
+
+        return resized_embeddings
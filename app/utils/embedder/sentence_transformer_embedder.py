@@ -1,6 +1,6 @@
 import numpy as np
 import torch
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 
 from .abstract_embedder import AbstractTextEmbedder
@@ -9,9 +9,17 @@ from .abstract_embedder import AbstractTextEmbedder
 class SentenceTransformerEmbedder(AbstractTextEmbedder):
     def __init__(self, model_name: str = 'all-MiniLM-L6-v2', feature_shape: Optional[Tuple[int, ...]] = None):
         self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
         self.feature_shape = feature_shape
 
     @torch.no_grad()
     def embed(self, text: str) -> np.ndarray:
         embedding = self.model.encode([text])[0]
         return self.resize_embedding(embedding, self.feature_shape)
+
+    @torch.no_grad()
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, self.feature_shape[0] if self.feature_shape else 0), dtype=np.float32)
+        embeddings = self.model.encode(texts)
+        return np.stack([self.resize_embedding(embedding, self.feature_shape) for embedding in embeddings])
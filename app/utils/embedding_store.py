@@ -0,0 +1,120 @@
+import argparse
+import os
+import threading
+from typing import Dict, Optional
+import numpy as np
+from app.log import logger
+from app.utils.indexer import FaissIndexer, faiss_index_registry
+from config import Config
+
+logger = logger.getChild(__name__)
+
+
+class EmbeddingStore:
+    """CLIP keyframe features addressable by FAISS id.
+
+    Row ``i`` of the ``.npy`` matrix written next to the FAISS index is the
+    vector FAISS stores under id ``i``. The matrix is memory-mapped and rows
+    are gathered with fancy indexing. Without the matrix the store falls back
+    to ``index.reconstruct``, which not every index type supports.
+    """
+
+    def __init__(self, indexer: FaissIndexer, embeddings_path: Optional[str] = Config.CLIP_EMBEDDINGS_PATH):
+        self.indexer = indexer
+        self.embeddings_path = embeddings_path
+        self.embeddings = self._load_embeddings(embeddings_path)
+
+    def __len__(self) -> int:
+        return self.indexer.ntotal
+
+    @property
+    def dim(self) -> int:
+        return self.indexer.d
+
+    @property
+    def memory_mapped(self) -> bool:
+        return self.embeddings is not None
+
+    def get(self, ids: np.ndarray) -> np.ndarray:
+        """Return the ``float32`` vectors of ``ids`` in the given order."""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        if len(ids) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+
+        # Gather each distinct row once, in file order, then expand.
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        if self.embeddings is not None:
+            rows = np.asarray(self.embeddings[unique_ids], dtype=np.float32)
+        else:
+            rows = self.indexer.reconstruct_batch(unique_ids)
+        return rows[inverse]
+
+    def get_range(self, start: int, count: int) -> np.ndarray:
+        if self.embeddings is not None:
+            return np.ascontiguousarray(self.embeddings[start:start + count], dtype=np.float32)
+        return np.ascontiguousarray(self.indexer.reconstruct_n(start, count))
+
+    def _load_embeddings(self, embeddings_path: Optional[str]) -> Optional[np.ndarray]:
+        if not embeddings_path or not os.path.exists(embeddings_path):
+            logger.warning(
+                f'No embedding matrix at {embeddings_path}, reconstructing vectors from the FAISS index')
+            return None
+
+        embeddings = np.load(embeddings_path, mmap_mode='r')
+        expected = (self.indexer.ntotal, self.indexer.d)
+        if embeddings.shape != expected:
+            logger.warning(
+                f'Embedding matrix {embeddings_path} has shape {embeddings.shape}, '
+                f'FAISS index has {expected}; reconstructing vectors from the index instead')
+            return None
+
+        logger.info(
+            f'Memory-mapped {embeddings.shape[0]} {embeddings.dtype} embeddings from {embeddings_path}')
+        return embeddings
+
+
+class EmbeddingStoreRegistry:
+    """Opens each embedding matrix once per process, like ``FaissIndexRegistry``."""
+
+    def __init__(self):
+        self._stores: Dict[str, EmbeddingStore] = {}
+        self._lock = threading.Lock()
+
+    def get(self, indexer: FaissIndexer, embeddings_path: Optional[str] = Config.CLIP_EMBEDDINGS_PATH) -> EmbeddingStore:
+        key = f'{indexer.index_path}:{embeddings_path}'
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                store = EmbeddingStore(indexer, embeddings_path)
+                self._stores[key] = store
+            return store
+
+
+embedding_store_registry = EmbeddingStoreRegistry()
+
+
+def export_embeddings(indexer: FaissIndexer, embeddings_path: str, dtype: str = 'float32', batch_size: int = 65536):
+    """Write the vectors of a reconstructable FAISS index as an id-aligned ``.npy`` matrix."""
+    ntotal, dim = indexer.ntotal, indexer.d
+    tmp_path = f'{embeddings_path}.tmp-{os.getpid()}.npy'
+    embeddings = np.lib.format.open_memmap(
+        tmp_path, mode='w+', dtype=np.dtype(dtype), shape=(ntotal, dim))
+    for start in range(0, ntotal, batch_size):
+        count = min(batch_size, ntotal - start)
+        embeddings[start:start + count] = indexer.reconstruct_n(start, count)
+        logger.info(f'Exported {start + count}/{ntotal} embeddings')
+    embeddings.flush()
+    del embeddings
+    os.replace(tmp_path, embeddings_path)
+    logger.info(f'Saved embedding matrix to {embeddings_path}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Export the CLIP keyframe vectors of a flat FAISS index as an id-aligned .npy matrix.')
+    parser.add_argument('--index', default=Config.FAISS_FLAT_BIN_PATH)
+    parser.add_argument('--output', default=Config.CLIP_EMBEDDINGS_PATH)
+    parser.add_argument('--dtype', choices=('float32', 'float16'), default='float32')
+    args = parser.parse_args()
+
+    export_embeddings(faiss_index_registry.get(args.index), args.output, args.dtype)
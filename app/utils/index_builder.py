@@ -0,0 +1,176 @@
+import argparse
+import json
+import math
+import os
+from typing import Iterable, Optional
+import faiss
+import numpy as np
+from app.log import logger
+from app.utils.data_manager.frame_snapshot import FrameSnapshotManager
+from app.utils.data_manager.frame_store import FrameStore, get_batch_id
+from app.utils.embedding_store import EmbeddingStore, embedding_store_registry
+from app.utils.indexer import SHARD_MANIFEST_NAME, faiss_index_registry, read_shard_manifest
+from config import Config
+
+logger = logger.getChild(__name__)
+
+INDEX_TYPES = ('ivf_flat', 'hnsw', 'ivf_pq')
+SHARD_INDEX_TYPES = ('flat',) + INDEX_TYPES
+
+
+def default_nlist(ntotal: int) -> int:
+    return max(1, min(ntotal // 39, int(4 * math.sqrt(ntotal))))
+
+
+def sample_training_vectors(store: EmbeddingStore, train_size: int, seed: int = 0, ids: Optional[np.ndarray] = None) -> np.ndarray:
+    if ids is None:
+        if train_size >= len(store):
+            return store.get_range(0, len(store))
+        ids = np.arange(len(store))
+    if train_size >= len(ids):
+        return store.get(ids)
+    rng = np.random.default_rng(seed)
+    return store.get(np.sort(rng.choice(ids, size=train_size, replace=False)))
+
+
+def create_index(index_type: str, d: int, ntotal: int, nlist: int = Config.FAISS_IVF_NLIST,
+                 hnsw_m: int = Config.FAISS_HNSW_M, ef_construction: int = Config.FAISS_HNSW_EF_CONSTRUCTION,
+                 code_size: int = Config.FAISS_PQ_CODE_SIZE) -> faiss.Index:
+    """Create an empty inner-product (cosine on normalized vectors) index of ``index_type``."""
+    if index_type == 'flat':
+        return faiss.IndexFlatIP(d)
+    if index_type == 'ivf_flat':
+        nlist = nlist or default_nlist(ntotal)
+        quantizer = faiss.IndexFlatIP(d)
+        index = faiss.IndexIVFFlat(
+            quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.own_fields = True
+        quantizer.this.disown()
+        return index
+    if index_type == 'ivf_pq':
+        if d % code_size:
+            raise ValueError(
+                f'PQ code size {code_size} must divide the dimension {d}')
+        nlist = nlist or default_nlist(ntotal)
+        # OPQ rotates the vectors so the 8-bit sub-quantizers lose less.
+        return faiss.index_factory(
+            d, f'OPQ{code_size},IVF{nlist},PQ{code_size}', faiss.METRIC_INNER_PRODUCT)
+    if index_type == 'hnsw':
+        index = faiss.IndexHNSWFlat(d, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        return index
+    raise ValueError(
+        f'Unknown index type {index_type!r}, expected one of {SHARD_INDEX_TYPES}')
+
+
+def build_index(store: EmbeddingStore, index_type: str, output_path: str, train_size: Optional[int] = None,
+                batch_size: int = 65536, ids: Optional[np.ndarray] = None, **index_options) -> faiss.Index:
+    """Build ``index_type`` over every vector of ``store``, keeping FAISS ids aligned with the flat index.
+
+    With ``ids`` only those vectors are added, and local id ``i`` is
+    ``ids[i]``; the caller keeps that mapping (see ``build_shards``).
+    """
+    ntotal = len(store) if ids is None else len(ids)
+    index = create_index(index_type, store.dim, ntotal, **index_options)
+
+    if not index.is_trained:
+        nlist = faiss.extract_index_ivf(index).nlist
+        train_size = train_size or min(ntotal, max(256 * nlist, 100_000))
+        logger.info(f'Training {index_type} index on {train_size} vectors')
+        index.train(sample_training_vectors(store, train_size, ids=ids))
+
+    for start in range(0, ntotal, batch_size):
+        count = min(batch_size, ntotal - start)
+        index.add(store.get_range(start, count) if ids is None
+                  else store.get(ids[start:start + count]))
+        logger.info(f'Added {start + count}/{ntotal} vectors')
+
+    if index_type in ('ivf_flat', 'ivf_pq'):
+        # Keep reconstruct() working for the embedding store fallback.
+        faiss.extract_index_ivf(index).make_direct_map()
+
+    tmp_path = f'{output_path}.tmp-{os.getpid()}'
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, output_path)
+    logger.info(f'Saved {index_type} index with {index.ntotal} vectors to {output_path}')
+    return index
+
+
+def frame_batches(frame_store: FrameStore) -> np.ndarray:
+    """Batch folder (``L01``, ...) of every frame index."""
+    video_batches = np.array([get_batch_id(str(video))
+                             for video in frame_store.videos], dtype=str)
+    return video_batches[frame_store.video_ids]
+
+
+def build_shards(store: EmbeddingStore, frame_store: FrameStore, shard_dir: str = Config.FAISS_SHARD_DIR,
+                 index_type: str = 'flat', batches: Optional[Iterable[str]] = None, **build_options):
+    """Build one ``index_type`` shard per batch folder for ``ShardedFaissIndexer``.
+
+    Only ``batches`` are (re)built when given, so a new batch does not
+    require rebuilding the others. Each shard stores the sorted global ids
+    of its vectors in ``ids.npy``.
+    """
+    if len(frame_store) != len(store):
+        raise ValueError(
+            f'Frame store has {len(frame_store)} frames but the embedding store has {len(store)} vectors')
+
+    frame_batch = frame_batches(frame_store)
+    all_batches = sorted(set(frame_batch.tolist()))
+    for batch in (sorted(batches) if batches else all_batches):
+        ids = np.flatnonzero(frame_batch == batch).astype(np.int64)
+        if len(ids) == 0:
+            raise ValueError(f'No frames belong to batch {batch!r}')
+        shard_path = os.path.join(shard_dir, batch)
+        os.makedirs(shard_path, exist_ok=True)
+        logger.info(f'Building {index_type} shard {batch} with {len(ids)} vectors')
+        build_index(store, index_type, os.path.join(shard_path, 'index.bin'),
+                    ids=ids, **build_options)
+        np.save(os.path.join(shard_path, 'ids.npy'), ids)
+
+    manifest = read_shard_manifest(shard_dir) or {}
+    manifest.update({
+        'ntotal': len(store),
+        'd': store.dim,
+        'shards': [batch for batch in all_batches
+                   if os.path.exists(os.path.join(shard_dir, batch, 'index.bin'))],
+    })
+    manifest_path = os.path.join(shard_dir, SHARD_MANIFEST_NAME)
+    tmp_path = f'{manifest_path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    logger.info(f"Saved shard manifest with shards {manifest['shards']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build an ANN variant of the CLIP keyframe index from the exact index and its embedding matrix.')
+    parser.add_argument('--type', choices=SHARD_INDEX_TYPES, required=True)
+    parser.add_argument('--source-index', default=Config.FAISS_FLAT_BIN_PATH)
+    parser.add_argument('--embeddings', default=Config.CLIP_EMBEDDINGS_PATH)
+    parser.add_argument('--output', default=None,
+                        help='Defaults to the path Config.FAISS_INDEX_PATHS has for --type')
+    parser.add_argument('--nlist', type=int, default=Config.FAISS_IVF_NLIST,
+                        help='IVF lists; 0 picks 4 * sqrt(ntotal)')
+    parser.add_argument('--train-size', type=int, default=None)
+    parser.add_argument('--hnsw-m', type=int, default=Config.FAISS_HNSW_M)
+    parser.add_argument('--ef-construction', type=int,
+                        default=Config.FAISS_HNSW_EF_CONSTRUCTION)
+    parser.add_argument('--code-size', type=int, default=Config.FAISS_PQ_CODE_SIZE,
+                        help='Bytes per vector of the ivf_pq index')
+    parser.add_argument('--shards', action='store_true',
+                        help='Build one index of --type per batch folder into --output (default FAISS_SHARD_DIR)')
+    parser.add_argument('--batches', nargs='+', default=None,
+                        help='With --shards, only (re)build these batches')
+    args = parser.parse_args()
+
+    source = faiss_index_registry.get(args.source_index)
+    store = embedding_store_registry.get(source, args.embeddings)
+    index_options = dict(train_size=args.train_size, nlist=args.nlist, hnsw_m=args.hnsw_m,
+                         ef_construction=args.ef_construction, code_size=args.code_size)
+    if args.shards:
+        build_shards(store, FrameSnapshotManager().load_or_build(), args.output or Config.FAISS_SHARD_DIR,
+                     args.type, args.batches, **index_options)
+    else:
+        build_index(store, args.type, args.output or Config.FAISS_INDEX_PATHS[args.type], **index_options)
@@ -1,15 +1,459 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import numpy as np
 import faiss
 from app.log import logger
+from config import Config
 
 logger = logger.getChild(__name__)
 
+
+def read_faiss_index(index_path: str) -> faiss.Index:
+    """Read an index memory-mapped where the index type supports it.
+
+    IVF inverted lists are mapped with ``IO_FLAG_MMAP``. Flat codes are only
+    mapped on FAISS builds with ``IO_FLAG_MMAP_IFC`` (not the pinned 1.7.2),
+    so a flat index is otherwise read into each process's own memory. Mapped
+    pages live in the page cache and are shared by every process that opens
+    the same file.
+    """
+    mmap_ifc = getattr(faiss, 'IO_FLAG_MMAP_IFC', 0)
+    io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | mmap_ifc
+    try:
+        index = faiss.read_index(index_path, io_flags)
+    except RuntimeError as e:
+        logger.warning(
+            f"Could not memory-map FAISS index {index_path}, reading it into memory: {e}")
+        return faiss.read_index(index_path)
+
+    if not _is_memory_mapped(index, bool(mmap_ifc)):
+        logger.info(
+            f"FAISS index {index_path} ({type(index).__name__}) was read into memory, not memory-mapped; "
+            "each process holds its own copy")
+    return index
+
+
+def _is_memory_mapped(index: faiss.Index, mmap_ifc: bool) -> bool:
+    """Whether ``read_faiss_index`` mapped the bulk of ``index``: IVF lists always, flat codes with ``mmap_ifc``."""
+    try:
+        faiss.extract_index_ivf(index)
+        return True
+    except RuntimeError:
+        return mmap_ifc and isinstance(index, faiss.IndexFlat)
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._writing)
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._condition.wait_for(lambda: not self._writing and self._readers == 0)
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
+
 class FaissIndexer:
-    def __init__(self, index_path: str):
-        self.index = faiss.read_index(index_path)
+    """A FAISS index plus its search-time knobs.
+
+    ``nprobe`` (IVF) and ``efSearch`` (HNSW) start from the deployment
+    defaults in ``Config`` and can be overridden per call through
+    ``search_params``; knobs that do not apply to the loaded index type are
+    ignored.
+    """
+
+    def __init__(self, index_path: str, search_params: Optional[Dict[str, int]] = None):
+        self.index_path = index_path
+        self.index = read_faiss_index(index_path)
+        self.ivf = self._extract_ivf()
+        # Searches hold it shared; changing the index-wide knobs holds it
+        # exclusively, so no search runs with another request's override.
+        self._param_lock = ReadWriteLock()
+        self.set_search_params(**{
+            'nprobe': Config.FAISS_NPROBE,
+            'efSearch': Config.FAISS_EF_SEARCH,
+            **(search_params or {}),
+        })
         logger.info(f"Loaded FAISS index from {index_path}")
         logger.info(f"Index total vectors: {self.index.ntotal}")
         logger.info(f"Index dimension: {self.index.d}")
+        logger.info(f"Index type: {self.describe()}")
+
+    @property
+    def ntotal(self) -> int:
+        return int(self.index.ntotal)
+
+    @property
+    def d(self) -> int:
+        return int(self.index.d)
+
+    @property
+    def index_type(self) -> str:
+        if isinstance(self.index, faiss.IndexHNSW):
+            return 'hnsw'
+        if isinstance(self.ivf, faiss.IndexIVFPQ):
+            return 'ivf_pq'
+        if isinstance(self.ivf, faiss.IndexIVFFlat):
+            return 'ivf_flat'
+        if self.ivf is not None:
+            return type(self.ivf).__name__
+        if isinstance(self.index, faiss.IndexFlat):
+            return 'flat'
+        return type(self.index).__name__
+
+    def describe(self) -> Dict[str, Any]:
+        """Index type, size and the current value of every search knob it supports."""
+        description = {
+            'type': self.index_type,
+            'class': type(self.index).__name__,
+            'ntotal': int(self.index.ntotal),
+            'd': int(self.index.d),
+            'metric': 'inner_product' if self.index.metric_type == faiss.METRIC_INNER_PRODUCT else 'l2',
+        }
+        if self.ivf is not None:
+            description['nlist'] = int(self.ivf.nlist)
+            description['code_size'] = int(self.ivf.code_size)
+            description['opq'] = isinstance(self.index, faiss.IndexPreTransform)
+        if isinstance(self.index, faiss.IndexHNSW):
+            description['M'] = int(self.index.hnsw.nb_neighbors(1))
+            description['efConstruction'] = int(self.index.hnsw.efConstruction)
+        description.update(self.get_search_params())
+        return description
+
+    def get_search_params(self) -> Dict[str, int]:
+        params = {}
+        if self.ivf is not None:
+            params['nprobe'] = int(self.ivf.nprobe)
+        if isinstance(self.index, faiss.IndexHNSW):
+            params['efSearch'] = int(self.index.hnsw.efSearch)
+        return params
+
+    def set_search_params(self, **params: Optional[int]):
+        """Set the deployment-wide search knobs; ``None`` values and unsupported knobs are skipped."""
+        with self._param_lock.write():
+            self._apply_search_params(**params)
+
+    def _apply_search_params(self, **params: Optional[int]):
+        supported = self.get_search_params()
+        for name, value in params.items():
+            if value is None or name not in supported:
+                continue
+            if name == 'nprobe':
+                self.ivf.nprobe = int(value)
+            elif name == 'efSearch':
+                self.index.hnsw.efSearch = int(value)
+
+    @property
+    def supports_id_filter(self) -> bool:
+        """Whether ``search`` can restrict itself to an id mask inside FAISS."""
+        if not hasattr(faiss, 'IDSelectorBitmap'):
+            return False
+        return isinstance(self.index, (faiss.IndexFlat, faiss.IndexIVF, faiss.IndexHNSW))
+
+    def search(self, query_vector: np.ndarray, k: int, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> tuple:
+        return self._search(query_vector.reshape(1, -1), k, search_params, id_mask)
+
+    def search_batch(self, query_vectors: np.ndarray, k: int, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> tuple:
+        """Search many query vectors in one call; row ``i`` of the results belongs to query ``i``."""
+        query_vectors = np.ascontiguousarray(
+            query_vectors.reshape(-1, self.index.d), dtype=np.float32)
+        return self._search(query_vectors, k, search_params, id_mask)
+
+    def _search(self, query_vectors: np.ndarray, k: int, search_params: Optional[Dict[str, int]], id_mask: Optional[np.ndarray] = None) -> tuple:
+        with self._param_lock.read():
+            current = self.get_search_params()
+            overrides = {name: int(value) for name, value in (search_params or {}).items()
+                         if value is not None and name in current and current[name] != value}
+            if id_mask is not None:
+                if not self.supports_id_filter:
+                    raise ValueError(
+                        f'{self.index_type} index at {self.index_path} cannot filter by id')
+                # The bitmap must stay alive until the search returns.
+                selector, bitmap = self._make_id_selector(id_mask)
+                return self.index.search(
+                    query_vectors, k, params=self._make_search_parameters({**current, **overrides}, selector))
+            if not overrides:
+                return self.index.search(query_vectors, k)
+
+            params = self._make_search_parameters(overrides)
+            if params is not None:
+                return self.index.search(query_vectors, k, params=params)
+
+        # FAISS builds without SearchParameters only have the index-wide
+        # knobs, so override them for this one search while no other search
+        # runs, and restore the defaults read under the same lock.
+        with self._param_lock.write():
+            current = self.get_search_params()
+            self._apply_search_params(**overrides)
+            try:
+                return self.index.search(query_vectors, k)
+            finally:
+                self._apply_search_params(**current)
+
+    def _make_search_parameters(self, overrides: Dict[str, int], selector=None):
+        # Wrapped indexes (e.g. OPQ in front of IVF) do not forward these.
+        # Search parameters replace every knob, so ``overrides`` must carry
+        # the current value of each knob whenever a selector is passed.
+        extra = {} if selector is None else {'sel': selector}
+        if 'nprobe' in overrides and isinstance(self.index, faiss.IndexIVF) and hasattr(faiss, 'SearchParametersIVF'):
+            return faiss.SearchParametersIVF(nprobe=overrides['nprobe'], **extra)
+        if 'efSearch' in overrides and isinstance(self.index, faiss.IndexHNSW) and hasattr(faiss, 'SearchParametersHNSW'):
+            return faiss.SearchParametersHNSW(efSearch=overrides['efSearch'], **extra)
+        if selector is not None:
+            return faiss.SearchParameters(sel=selector)
+        return None
+
+    @staticmethod
+    def _make_id_selector(id_mask: np.ndarray) -> tuple:
+        """Selector over the ids set in ``id_mask``: one range when they are contiguous, a bitmap otherwise."""
+        ids = np.flatnonzero(id_mask)
+        if len(ids) and ids[-1] - ids[0] + 1 == len(ids):
+            return faiss.IDSelectorRange(int(ids[0]), int(ids[-1]) + 1), None
+        bitmap = np.packbits(np.asarray(id_mask, dtype=bool), bitorder='little')
+        return faiss.IDSelectorBitmap(len(id_mask), faiss.swig_ptr(bitmap)), bitmap
+
+    def reconstruct_batch(self, ids: np.ndarray) -> np.ndarray:
+        """Stored vectors of ``ids``; not every index type can reconstruct."""
+        ids = np.asarray(ids, dtype=np.int64)
+        if hasattr(self.index, 'reconstruct_batch'):
+            return np.asarray(self.index.reconstruct_batch(ids), dtype=np.float32)
+        rows = np.empty((len(ids), self.d), dtype=np.float32)
+        for i, idx in enumerate(ids):
+            self.index.reconstruct(int(idx), rows[i])
+        return rows
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        return np.asarray(self.index.reconstruct_n(start, count), dtype=np.float32)
+
+    def _extract_ivf(self):
+        try:
+            return faiss.extract_index_ivf(self.index)
+        except RuntimeError:
+            return None
+
+
+SHARD_MANIFEST_NAME = 'manifest.json'
+
+
+def read_shard_manifest(shard_dir: str) -> Optional[Dict]:
+    path = os.path.join(shard_dir, SHARD_MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+class IndexShard:
+    """One batch's FAISS index and the global id of each of its local ids."""
+
+    def __init__(self, name: str, indexer: FaissIndexer, ids: np.ndarray):
+        if len(ids) != indexer.ntotal:
+            raise ValueError(
+                f'Shard {name} has {indexer.ntotal} vectors but {len(ids)} ids')
+        self.name = name
+        self.indexer = indexer
+        self.ids = ids
+
+    def local_ids(self, global_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(found, local_ids)`` for ``global_ids``; ``ids`` is sorted ascending."""
+        positions = np.minimum(np.searchsorted(
+            self.ids, global_ids), len(self.ids) - 1)
+        found = self.ids[positions] == global_ids
+        return found, positions
+
+
+class ShardedFaissIndexer:
+    """One FAISS index per video batch, searched in parallel and merged into a global top-k.
+
+    ``shard_dir`` holds a manifest plus one folder per batch with the shard's
+    ``index.bin`` and ``ids.npy``, the flat-index (global) id of every local
+    id, so results keep addressing the frame store and embedding matrix.
+    Shards can be loaded and unloaded at runtime; searches only see the
+    loaded ones, and an id mask skips shards it excludes entirely.
+    """
+
+    def __init__(self, shard_dir: str, search_params: Optional[Dict[str, int]] = None,
+                 shards: Optional[Iterable[str]] = None, workers: int = Config.FAISS_SHARD_WORKERS):
+        manifest = read_shard_manifest(shard_dir)
+        if manifest is None:
+            raise FileNotFoundError(f'No shard manifest in {shard_dir}')
+        self.index_path = shard_dir
+        self.available_shards: List[str] = list(manifest['shards'])
+        self._ntotal = int(manifest['ntotal'])
+        self._d = int(manifest['d'])
+        self.search_params = search_params
+        self.shards: Dict[str, IndexShard] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='faiss-shard')
+        for name in (shards or self.available_shards):
+            self.load_shard(name)
+        logger.info(f"Index type: {self.describe()}")
+
+    @property
+    def ntotal(self) -> int:
+        """Size of the global id space, loaded or not."""
+        return self._ntotal
+
+    @property
+    def d(self) -> int:
+        return self._d
+
+    @property
+    def index_type(self) -> str:
+        return 'sharded'
+
+    @property
+    def shard_names(self) -> List[str]:
+        with self._lock:
+            return sorted(self.shards)
+
+    @property
+    def supports_id_filter(self) -> bool:
+        return all(shard.indexer.supports_id_filter for shard in self._loaded())
+
+    def loaded_mask(self) -> np.ndarray:
+        """Boolean mask over the global id space of the ids held by loaded shards."""
+        mask = np.zeros(self.ntotal, dtype=bool)
+        for shard in self._loaded():
+            mask[shard.ids] = True
+        return mask
+
+    def load_shard(self, name: str) -> IndexShard:
+        if name not in self.available_shards:
+            raise KeyError(f'Unknown shard {name!r} in {self.index_path}')
+        shard_path = os.path.join(self.index_path, name)
+        shard = IndexShard(name,
+                           FaissIndexer(os.path.join(shard_path, 'index.bin'), self.search_params),
+                           np.load(os.path.join(shard_path, 'ids.npy')))
+        with self._lock:
+            self.shards[name] = shard
+        logger.info(f'Loaded shard {name} ({shard.indexer.ntotal} vectors)')
+        return shard
+
+    def unload_shard(self, name: str):
+        with self._lock:
+            shard = self.shards.pop(name, None)
+        if shard is None:
+            raise KeyError(f'Shard {name!r} is not loaded')
+        logger.info(f'Unloaded shard {name}')
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            'type': self.index_type,
+            'ntotal': self.ntotal,
+            'd': self.d,
+            'shards': {shard.name: shard.indexer.describe() for shard in self._loaded()},
+        }
+
+    def get_search_params(self) -> Dict[str, int]:
+        shards = self._loaded()
+        return shards[0].indexer.get_search_params() if shards else {}
+
+    def set_search_params(self, **params: Optional[int]):
+        for shard in self._loaded():
+            shard.indexer.set_search_params(**params)
+
+    def search(self, query_vector: np.ndarray, k: int, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> tuple:
+        return self.search_batch(query_vector.reshape(1, -1), k, search_params, id_mask)
+
+    def search_batch(self, query_vectors: np.ndarray, k: int, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> tuple:
+        """Search every loaded shard in parallel and merge their top ``k`` into a global top ``k``."""
+        query_vectors = np.ascontiguousarray(
+            query_vectors.reshape(-1, self.d), dtype=np.float32)
+        jobs = []
+        for shard in self._loaded():
+            shard_mask = None if id_mask is None else id_mask[shard.ids]
+            if shard_mask is not None:
+                if not shard_mask.any():
+                    continue
+                if shard_mask.all():
+                    shard_mask = None
+            jobs.append((shard, self._pool.submit(
+                shard.indexer.search_batch, query_vectors, k, search_params, shard_mask)))
+        return self._merge([(shard, job.result()) for shard, job in jobs], len(query_vectors), k)
+
+    def reconstruct_batch(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.empty((len(ids), self.d), dtype=np.float32)
+        missing = np.ones(len(ids), dtype=bool)
+        for shard in self._loaded():
+            found, local_ids = shard.local_ids(ids)
+            if found.any():
+                rows[found] = shard.indexer.reconstruct_batch(local_ids[found])
+                missing &= ~found
+        if missing.any():
+            raise KeyError(
+                f'{int(missing.sum())} ids are not in any loaded shard')
+        return rows
+
+    def reconstruct_n(self, start: int, count: int) -> np.ndarray:
+        return self.reconstruct_batch(np.arange(start, start + count))
+
+    def _loaded(self) -> List[IndexShard]:
+        with self._lock:
+            return list(self.shards.values())
+
+    def _merge(self, results: List[Tuple[IndexShard, tuple]], n_queries: int, k: int) -> tuple:
+        # Every shard is an inner-product index, so higher is better; pad like
+        # FAISS does when fewer than ``k`` results exist.
+        distances = [np.full((n_queries, k), np.finfo(np.float32).min, dtype=np.float32)]
+        ids = [np.full((n_queries, k), -1, dtype=np.int64)]
+        for shard, (shard_distances, local_ids) in results:
+            distances.append(shard_distances)
+            ids.append(np.where(local_ids >= 0, shard.ids[np.maximum(local_ids, 0)], -1))
+        distances = np.concatenate(distances, axis=1)
+        ids = np.concatenate(ids, axis=1)
+
+        order = np.argsort(np.where(ids >= 0, -distances, np.inf),
+                           axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class FaissIndexRegistry:
+    """Opens each FAISS index file once per process and hands out the same indexer.
+
+    A directory is opened as a ``ShardedFaissIndexer``.
+    """
+
+    def __init__(self):
+        self._indexers: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, index_path: str) -> FaissIndexer:
+        with self._lock:
+            indexer = self._indexers.get(index_path)
+            if indexer is None:
+                indexer = (ShardedFaissIndexer(index_path, shards=Config.FAISS_SHARDS or None)
+                           if os.path.isdir(index_path) else FaissIndexer(index_path))
+                self._indexers[index_path] = indexer
+            return indexer
+
 
-    def search(self, query_vector: np.ndarray, k: int) -> tuple:
-        return self.index.search(query_vector.reshape(1, -1), k)
+faiss_index_registry = FaissIndexRegistry()
@@ -0,0 +1,226 @@
+import argparse
+import json
+import os
+import shutil
+from typing import Dict, Optional, Tuple
+import numpy as np
+from app.log import logger
+from app.utils.embedding_store import EmbeddingStore, embedding_store_registry
+from app.utils.indexer import FaissIndexer, faiss_index_registry
+from config import Config
+
+logger = logger.getChild(__name__)
+
+# Bump whenever the layout of the graph files changes.
+GRAPH_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+
+
+def index_fingerprint(indexer: FaissIndexer) -> Dict:
+    stat = os.stat(indexer.index_path)
+    return {
+        'path': os.path.abspath(indexer.index_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'ntotal': indexer.ntotal,
+        'd': indexer.d,
+    }
+
+
+class KnnGraph:
+    """Precomputed top-k neighbours of every keyframe in the CLIP index.
+
+    Row ``i`` of ``neighbor_ids`` (``int32``) and ``similarities``
+    (``float16``) holds the ids and FAISS scores of keyframe ``i``'s nearest
+    neighbours, best first, exactly as ``index.search`` returns them for that
+    keyframe's own vector (so the keyframe itself is usually column 0).
+    """
+
+    def __init__(self, neighbor_ids: np.ndarray, similarities: np.ndarray):
+        self.neighbor_ids = neighbor_ids
+        self.similarities = similarities
+
+    def __len__(self) -> int:
+        return len(self.neighbor_ids)
+
+    @property
+    def k(self) -> int:
+        return self.neighbor_ids.shape[1]
+
+    def neighbors(self, ids: np.ndarray, k: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(similarities, neighbor_ids)`` for ``ids``, shaped like ``index.search`` output."""
+        k = self.k if k is None else k
+        if k > self.k:
+            raise ValueError(f'Graph stores {self.k} neighbours, {k} requested')
+        ids = np.asarray(ids, dtype=np.int64)
+        return (self.similarities[ids, :k].astype(np.float32),
+                self.neighbor_ids[ids, :k].astype(np.int64))
+
+    @classmethod
+    def load(cls, graph_dir: str, indexer: FaissIndexer, check_samples: int = Config.KNN_GRAPH_CHECK_SAMPLES) -> Optional['KnnGraph']:
+        """Memory-map the graph if it is complete and matches ``indexer``; ``None`` otherwise."""
+        manifest = read_manifest(graph_dir)
+        if manifest is None:
+            logger.info(f'No kNN graph found at {graph_dir}')
+            return None
+        if manifest.get('version') != GRAPH_VERSION or not manifest.get('complete'):
+            logger.info(f'kNN graph at {graph_dir} is incomplete or outdated')
+            return None
+
+        recorded = manifest.get('index', {})
+        current = index_fingerprint(indexer)
+        if recorded.get('ntotal') != current['ntotal'] or recorded.get('d') != current['d']:
+            logger.warning(
+                f'kNN graph at {graph_dir} was built for a different index, ignoring it')
+            return None
+
+        graph = cls(np.load(os.path.join(graph_dir, 'neighbor_ids.npy'), mmap_mode='r'),
+                    np.load(os.path.join(graph_dir, 'similarities.npy'), mmap_mode='r'))
+        if (recorded.get('size'), recorded.get('mtime_ns')) != (current['size'], current['mtime_ns']) \
+                and not graph.is_consistent(indexer, check_samples):
+            logger.warning(
+                f'kNN graph at {graph_dir} is stale for {indexer.index_path}, ignoring it')
+            return None
+
+        logger.info(
+            f'Loaded kNN graph from {graph_dir} ({len(graph)} keyframes, k={graph.k})')
+        return graph
+
+    def is_consistent(self, indexer: FaissIndexer, samples: int = Config.KNN_GRAPH_CHECK_SAMPLES, seed: int = 0) -> bool:
+        """Re-search a random sample of keyframes on the live index and compare neighbours."""
+        if len(self) != indexer.ntotal:
+            return False
+        if len(self) == 0 or samples <= 0:
+            return True
+
+        rng = np.random.default_rng(seed)
+        ids = np.sort(rng.choice(len(self), size=min(samples, len(self)), replace=False))
+        vectors = embedding_store_registry.get(indexer).get(ids)
+        live_similarities, live_ids = indexer.search_batch(vectors, self.k)
+        stored_similarities, stored_ids = self.neighbors(ids)
+
+        # Ties can reorder neighbours, so compare the neighbour sets and
+        # allow for float16 rounding of the scores.
+        same_ids = all(set(live) == set(stored)
+                       for live, stored in zip(live_ids, stored_ids))
+        same_scores = np.allclose(
+            np.sort(live_similarities, axis=1), np.sort(stored_similarities, axis=1), atol=1e-2)
+        if not (same_ids and same_scores):
+            logger.warning(
+                'kNN graph disagrees with the live index on sampled keyframes')
+        return same_ids and same_scores
+
+
+class KnnGraphBuilder:
+    """Computes the kNN graph in batches, writing straight into memory-mapped files.
+
+    Progress is recorded in the manifest after every batch, so an interrupted
+    build resumes from the last finished batch.
+    """
+
+    def __init__(self, indexer: FaissIndexer, graph_dir: str = Config.KNN_GRAPH_DIR, k: int = Config.KNN_GRAPH_K, batch_size: int = 4096, embedding_store: Optional[EmbeddingStore] = None):
+        self.indexer = indexer
+        self.embedding_store = embedding_store or embedding_store_registry.get(
+            indexer)
+        self.graph_dir = graph_dir
+        self.k = k
+        self.batch_size = batch_size
+
+    def build(self, force: bool = False) -> KnnGraph:
+        ntotal = self.indexer.ntotal
+        fingerprint = index_fingerprint(self.indexer)
+        manifest = None if force else read_manifest(self.graph_dir)
+        if manifest is not None and not self._can_resume(manifest, fingerprint):
+            manifest = None
+
+        if manifest is None:
+            shutil.rmtree(self.graph_dir, ignore_errors=True)
+            os.makedirs(self.graph_dir)
+            mode = 'w+'
+            manifest = {
+                'version': GRAPH_VERSION,
+                'k': self.k,
+                'index': fingerprint,
+                'completed_rows': 0,
+                'complete': False,
+            }
+            write_manifest(self.graph_dir, manifest)
+        else:
+            mode = 'r+'
+            logger.info(
+                f"Resuming kNN graph build at row {manifest['completed_rows']}/{ntotal}")
+
+        neighbor_ids = np.lib.format.open_memmap(
+            os.path.join(self.graph_dir, 'neighbor_ids.npy'), mode=mode, dtype=np.int32, shape=(ntotal, self.k))
+        similarities = np.lib.format.open_memmap(
+            os.path.join(self.graph_dir, 'similarities.npy'), mode=mode, dtype=np.float16, shape=(ntotal, self.k))
+
+        for start in range(manifest['completed_rows'], ntotal, self.batch_size):
+            count = min(self.batch_size, ntotal - start)
+            batch_similarities, batch_ids = self.indexer.search_batch(
+                self.embedding_store.get_range(start, count), self.k)
+            neighbor_ids[start:start + count] = batch_ids
+            similarities[start:start + count] = batch_similarities
+            neighbor_ids.flush()
+            similarities.flush()
+
+            manifest['completed_rows'] = start + count
+            write_manifest(self.graph_dir, manifest)
+            logger.info(f'kNN graph: {start + count}/{ntotal} keyframes')
+
+        manifest['complete'] = True
+        write_manifest(self.graph_dir, manifest)
+        logger.info(f'Saved kNN graph to {self.graph_dir}')
+        return KnnGraph(neighbor_ids, similarities)
+
+    def _can_resume(self, manifest: Dict, fingerprint: Dict) -> bool:
+        if manifest.get('version') != GRAPH_VERSION or manifest.get('k') != self.k:
+            return False
+        if manifest.get('index') != fingerprint:
+            logger.info('FAISS index changed since the kNN graph was started, rebuilding')
+            return False
+        return all(os.path.exists(os.path.join(self.graph_dir, name))
+                   for name in ('neighbor_ids.npy', 'similarities.npy'))
+
+
+def read_manifest(graph_dir: str) -> Optional[Dict]:
+    path = os.path.join(graph_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f'Invalid kNN graph manifest {path}: {e}')
+        return None
+
+
+def write_manifest(graph_dir: str, manifest: Dict):
+    path = os.path.join(graph_dir, MANIFEST_NAME)
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Precompute the top-k neighbours of every keyframe in the CLIP index.')
+    parser.add_argument('--index', default=Config.FAISS_BIN_PATH)
+    parser.add_argument('--graph-dir', default=Config.KNN_GRAPH_DIR)
+    parser.add_argument('-k', type=int, default=Config.KNN_GRAPH_K)
+    parser.add_argument('--batch-size', type=int, default=4096)
+    parser.add_argument('--force', action='store_true',
+                        help='Start over instead of resuming an unfinished build')
+    parser.add_argument('--check', action='store_true',
+                        help='Only check an existing graph against the live index')
+    args = parser.parse_args()
+
+    indexer = faiss_index_registry.get(args.index)
+    if args.check:
+        graph = KnnGraph.load(args.graph_dir, indexer)
+        if graph is None or not graph.is_consistent(indexer):
+            raise SystemExit(f'kNN graph at {args.graph_dir} is missing or stale')
+        logger.info(f'kNN graph at {args.graph_dir} is consistent with {args.index}')
+    else:
+        KnnGraphBuilder(indexer, args.graph_dir, args.k, args.batch_size).build(force=args.force)
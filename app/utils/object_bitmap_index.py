@@ -0,0 +1,136 @@
+from array import array
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from pyroaring import BitMap
+from app.log import logger
+from app.models import ObjectQuery, QueryLogic
+from app.utils.data_manager.frame_store import CATEGORIES, CATEGORY_TO_ID, FrameStore
+from app.utils.data_manager.visual_encoding_manager import VisualEncoding
+from config import Config
+
+logger = logger.getChild(__name__)
+
+
+def to_mask(bitmap: BitMap, size: int) -> np.ndarray:
+    mask = np.zeros(size, dtype=bool)
+    if bitmap:
+        mask[np.frombuffer(bitmap.to_array(), dtype=np.uint32)] = True
+    return mask
+
+
+class ObjectBitmapIndex:
+    """Roaring bitmaps of frame indices for evaluating the structure of a grid query.
+
+    ``cells[t][(cell, category)]`` holds the frames with a detection of
+    ``category`` within ``t`` grid cells of ``cell`` (``a0`` ... ``g6``), and
+    ``counts[(category, n)]`` the frames with exactly ``n`` detections of it.
+    Counts of ``count_buckets`` or more share the last bucket.
+    """
+
+    def __init__(self, n_frames: int, cells: List[Dict[Tuple[str, int], BitMap]], counts: Dict[Tuple[int, int], BitMap],
+                 count_buckets: int = Config.OBJECT_COUNT_BUCKETS):
+        self.n_frames = n_frames
+        self.cells = cells
+        self.counts = counts
+        self.count_buckets = count_buckets
+
+    @classmethod
+    def from_store(cls, store: FrameStore, count_buckets: int = Config.OBJECT_COUNT_BUCKETS,
+                   max_spatial_tolerance: int = Config.OBJECT_MAX_SPATIAL_TOLERANCE,
+                   row_mask: Optional[np.ndarray] = None) -> 'ObjectBitmapIndex':
+        """Build the bitmaps from the packed detection columns of ``store``, for the frames in ``row_mask`` if given."""
+        n_categories = len(CATEGORY_TO_ID)
+        det_frames = np.repeat(np.arange(len(store), dtype=np.int64), np.diff(store.det_offsets))
+        det_categories = store.det_category.astype(np.int64)
+        token_cells = np.array([str(token)[:2] for token in store.tokens])
+        cell_labels, token_cell_ids = np.unique(token_cells, return_inverse=True)
+        det_cells = token_cell_ids[store.det_token]
+        if row_mask is not None:
+            kept = np.asarray(row_mask, dtype=bool)[det_frames]
+            det_frames, det_categories, det_cells = det_frames[kept], det_categories[kept], det_cells[kept]
+
+        cells: Dict[Tuple[str, int], BitMap] = {}
+        keys = (det_cells * n_categories + det_categories) * len(store) + det_frames
+        for (cell_id, category), frames in _group_frames(keys, len(store), n_categories).items():
+            cells[(str(cell_labels[cell_id]), category)] = frames
+        dilated = [cells] + [cls._dilate(cells, tolerance)
+                             for tolerance in range(1, max_spatial_tolerance + 1)]
+
+        frame_categories, per_frame = np.unique(
+            det_frames * n_categories + det_categories, return_counts=True)
+        buckets = np.minimum(per_frame, count_buckets)
+        count_keys = ((frame_categories % n_categories) * (count_buckets + 1) + buckets) * len(store) \
+            + frame_categories // n_categories
+        counts = _group_frames(count_keys, len(store), count_buckets + 1)
+
+        logger.info(
+            f'Built object bitmaps: {len(cells)} (cell, category) and {len(counts)} (category, count) bitmaps')
+        return cls(len(store), dilated, counts, count_buckets)
+
+    @staticmethod
+    def _dilate(cells: Dict[Tuple[str, int], BitMap], tolerance: int) -> Dict[Tuple[str, int], BitMap]:
+        neighbours = VisualEncoding([category.value for category in CATEGORIES]).neighbour_cells(tolerance)
+        dilated = {}
+        for cell, near in neighbours.items():
+            for category in range(len(CATEGORIES)):
+                frames = BitMap.union(BitMap(), *(
+                    cells[(neighbour, category)] for neighbour, _ in near if (neighbour, category) in cells))
+                if frames:
+                    dilated[(cell, category)] = frames
+        return dilated
+
+    def match(self, query: ObjectQuery) -> Optional[BitMap]:
+        """Frames satisfying the query's cells under its AND/OR logic and ``max_objects``; ``None`` for an empty grid.
+
+        A placed object also matches detections within the query's
+        ``spatial_tolerance`` (capped at the precomputed levels).
+        """
+        cells = query.cells()
+        if not cells:
+            return None
+
+        cell_bitmaps = self.cells[min(query.spatial_tolerance, len(self.cells) - 1)]
+        bitmaps = [cell_bitmaps.get((cell, CATEGORY_TO_ID[category]), BitMap())
+                   for cell, category in cells]
+        if query.logic == QueryLogic.AND:
+            frames = BitMap.intersection(*bitmaps)
+        else:
+            frames = BitMap.union(*bitmaps)
+
+        if query.max_objects is not None:
+            # Drop frames with too many of a placed category; frames without
+            # it at all stay, so OR panels still match on other cells.
+            for category in {category for _, category in cells}:
+                frames = frames - self.count_above(CATEGORY_TO_ID[category], query.max_objects)
+        return frames
+
+    def count_above(self, category: int, max_count: int) -> BitMap:
+        """Frames with more than ``max_count`` detections of ``category``.
+
+        Counts of ``count_buckets`` or more share a bucket, so from
+        ``count_buckets`` on this is empty and such frames are kept.
+        """
+        return BitMap.union(BitMap(), *(
+            self.counts.get((category, n), BitMap())
+            for n in range(max_count + 1, self.count_buckets + 1)))
+
+    def match_mask(self, query: ObjectQuery, id_mask: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """``match`` as a boolean frame mask, combined with ``id_mask``."""
+        frames = self.match(query)
+        if frames is None:
+            return id_mask
+        mask = to_mask(frames, self.n_frames)
+        return mask if id_mask is None else mask & id_mask[:self.n_frames]
+
+
+def _group_frames(keys: np.ndarray, n_frames: int, n_values: int) -> Dict[Tuple[int, int], BitMap]:
+    """Split ``(group * n_frames + frame)`` keys into one bitmap of frames per ``(group // n_values, group % n_values)``."""
+    keys = np.unique(keys)
+    groups, frames = np.divmod(keys, n_frames)
+    boundaries = np.flatnonzero(np.diff(groups)) + 1
+    starts = np.concatenate([[0], boundaries])
+    return {
+        (int(groups[start] // n_values), int(groups[start] % n_values)): BitMap(array('I', frames[start:end].astype(np.uint32).tobytes()))
+        for start, end in zip(starts, np.concatenate([boundaries, [len(keys)]]))
+        if end > start
+    }
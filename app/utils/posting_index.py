@@ -0,0 +1,105 @@
+from typing import Optional, Tuple
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+
+def restrict_rows(matrix, row_mask: Optional[np.ndarray] = None) -> csr_matrix:
+    """``matrix`` with every row outside ``row_mask`` emptied.
+
+    The shape, and so the frame index of every row, is unchanged; only the
+    stored entries shrink.
+    """
+    matrix = csr_matrix(matrix)
+    if row_mask is None:
+        return matrix
+    lengths = np.diff(matrix.indptr)
+    kept_rows = np.asarray(row_mask[:matrix.shape[0]], dtype=bool)
+    keep = np.repeat(kept_rows, lengths)
+    indptr = np.concatenate([[0], np.cumsum(np.where(kept_rows, lengths, 0))])
+    return csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+
+
+class PostingIndex:
+    """Inverted index over the rows of a sparse ``(frames, terms)`` weight matrix.
+
+    Rows are L2-normalized once and the matrix is stored column-wise, so the
+    postings of term ``t`` are ``frame_ids[indptr[t]:indptr[t + 1]]`` with
+    their weights. Scoring a query touches only the postings of its terms and
+    gives exactly ``cosine_similarity(matrix, query)``.
+    """
+
+    def __init__(self, matrix: csr_matrix):
+        matrix = csr_matrix(matrix, dtype=np.float32)
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        postings = (diags(1.0 / norms) @ matrix).tocsc()
+        postings.sort_indices()
+
+        self.n_rows, self.n_terms = matrix.shape
+        self.indptr = postings.indptr.astype(np.int64)
+        self.frame_ids = postings.indices.astype(np.int64)
+        self.weights = postings.data.astype(np.float32)
+        # Largest weight in each posting list, the MaxScore upper bound.
+        self.max_weights = np.zeros(self.n_terms, dtype=np.float32)
+        lengths = np.diff(self.indptr)
+        nonempty = lengths > 0
+        self.max_weights[nonempty] = np.maximum.reduceat(
+            self.weights, self.indptr[:-1][nonempty]) if len(self.weights) else 0
+
+    def __len__(self) -> int:
+        return self.n_rows
+
+    def postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[term], self.indptr[term + 1]
+        return self.frame_ids[start:end], self.weights[start:end]
+
+    def search(self, query_vector, k: int, id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(scores, frame_ids)`` of the ``k`` best rows with a positive score, best first.
+
+        Terms are visited in decreasing order of their best possible
+        contribution (MaxScore). Once the current ``k``-th score reaches the
+        most the unvisited terms could add, rows not seen yet cannot enter
+        the top ``k``, and the remaining postings only update known rows.
+        """
+        query = csr_matrix(query_vector, dtype=np.float32)
+        query.sum_duplicates()
+        terms, term_weights = query.indices, query.data
+        query_norm = float(np.sqrt(np.sum(query.data ** 2)))
+        if k <= 0 or len(terms) == 0 or query_norm == 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        term_weights = term_weights / query_norm
+
+        bounds = term_weights * self.max_weights[terms]
+        order = np.argsort(-bounds, kind='stable')
+        remaining = np.cumsum(bounds[order][::-1])[::-1]
+
+        candidates = np.empty(0, dtype=np.int64)
+        scores = np.empty(0, dtype=np.float32)
+        for position, term_index in enumerate(order):
+            frame_ids, weights = self.postings(terms[term_index])
+            if id_mask is not None:
+                keep = id_mask[frame_ids]
+                frame_ids, weights = frame_ids[keep], weights[keep]
+            contributions = weights * term_weights[term_index]
+
+            if len(candidates) >= k and self._kth_score(scores, k) >= remaining[position]:
+                slots = np.minimum(np.searchsorted(candidates, frame_ids), len(candidates) - 1)
+                known = candidates[slots] == frame_ids
+                scores[slots[known]] += contributions[known]
+            else:
+                candidates, inverse = np.unique(
+                    np.concatenate([candidates, frame_ids]), return_inverse=True)
+                scores = np.bincount(inverse, weights=np.concatenate(
+                    [scores, contributions]), minlength=len(candidates)).astype(np.float32)
+
+        positive = scores > 0
+        candidates, scores = candidates[positive], scores[positive]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[top], scores[top]
+        order = np.lexsort((candidates, -scores))
+        return scores[order], candidates[order]
+
+    @staticmethod
+    def _kth_score(scores: np.ndarray, k: int) -> float:
+        return float(np.partition(scores, len(scores) - k)[len(scores) - k])
@@ -1,10 +1,13 @@
 import os
 import pickle
-from scipy.sparse import load_npz
+from typing import List, Optional
+from scipy.sparse import csr_matrix, load_npz
 
-from sklearn.metrics.pairwise import cosine_similarity
 from app.utils.query_vectorizer.abstract_query_vectorizer import AbstractQueryVectorizer
-from app.models import ObjectQuery
+from app.models import Category, ObjectQuery
+from app.utils.data_manager.visual_encoding_manager import VisualEncoding
+from app.utils.object_bitmap_index import ObjectBitmapIndex
+from app.utils.posting_index import PostingIndex, restrict_rows
 import numpy as np
 from app.log import logger
 
@@ -13,9 +16,21 @@ from config import Config
 logger = logger.getChild(__name__)
 
 class ObjectQueryVectorizer(AbstractQueryVectorizer):
-    def __init__(self):
+    def __init__(self, bitmap_index: Optional[ObjectBitmapIndex] = None,
+                 max_spatial_tolerance: int = Config.OBJECT_MAX_SPATIAL_TOLERANCE,
+                 neighbour_weight: float = Config.OBJECT_NEIGHBOUR_WEIGHT,
+                 row_mask: Optional[np.ndarray] = None):
         self.vectorizer = self.__load_vectorizer()
-        self.vectors = self.__load_vectors()
+        # A shard worker keeps only the rows of the frames it owns.
+        self.vectors = restrict_rows(self.__load_vectors(), row_mask)
+        self.grid = VisualEncoding([category.value for category in Category])
+        self.neighbour_weight = neighbour_weight
+        # indexes[t] holds the postings dilated to cells up to t away.
+        self.indexes: List[PostingIndex] = [
+            PostingIndex(self.vectors if tolerance == 0 else self.vectors @ self.dilation_matrix(tolerance))
+            for tolerance in range(max_spatial_tolerance + 1)]
+        self.index = self.indexes[0]
+        self.bitmap_index = bitmap_index
         logger.debug(f'vectorizer: {self.vectorizer}')
         logger.debug(f'vector: {self.vectors}')
         
@@ -37,8 +52,37 @@ class ObjectQueryVectorizer(AbstractQueryVectorizer):
         logger.info(f'Object processed query: {query_text}')
         return self.vectorizer.transform([query_text])
 
-    def search(self, query_vector, k):   
-        similarities = cosine_similarity(self.vectors, query_vector).flatten()
-                
-        top_indices = similarities.argsort()[-k:][::-1]
-        return similarities, top_indices
+    def dilation_matrix(self, tolerance: int) -> csr_matrix:
+        """``(terms, terms)`` matrix spreading each ``<cell><label>`` term to the same label in nearby cells.
+
+        Entry ``[source, target]`` is ``neighbour_weight ** distance`` for
+        the cells up to ``tolerance`` apart, so ``vectors @ matrix`` indexes
+        every detection in its neighbouring cells at a reduced weight.
+        """
+        vocabulary = self.vectorizer.vocabulary_
+        neighbours = self.grid.neighbour_cells(tolerance)
+        rows, cols, weights = [], [], []
+        for term, source in vocabulary.items():
+            cell, label = term[:2], term[2:]
+            for neighbour, distance in neighbours.get(cell, [(cell, 0)]):
+                target = vocabulary.get(f'{neighbour}{label}')
+                if target is not None:
+                    rows.append(source)
+                    cols.append(target)
+                    weights.append(self.neighbour_weight ** distance)
+        return csr_matrix((weights, (rows, cols)), shape=(len(vocabulary), len(vocabulary)), dtype=np.float32)
+
+    def match_mask(self, query: ObjectQuery, id_mask: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        """Restrict ``id_mask`` to the frames satisfying the query's AND/OR logic and ``max_objects``."""
+        if self.bitmap_index is None:
+            return id_mask
+        return self.bitmap_index.match_mask(query, id_mask)
+
+    def search(self, query_vector, k, id_mask: Optional[np.ndarray] = None, spatial_tolerance: int = 0):
+        """Return ``(similarities, indices)`` of the ``k`` most similar frames with a positive score, best first.
+
+        ``spatial_tolerance`` selects the dilated postings and is capped at
+        ``OBJECT_MAX_SPATIAL_TOLERANCE``.
+        """
+        index = self.indexes[min(spatial_tolerance, len(self.indexes) - 1)]
+        return index.search(query_vector, k, id_mask)
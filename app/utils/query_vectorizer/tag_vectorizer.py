@@ -1,22 +1,35 @@
 import os
 import pickle
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 import numpy as np
 from scipy.sparse import load_npz
-from sklearn.metrics.pairwise import cosine_similarity
 from app.log import logger
 from app.models import TagQuery
+from app.utils.posting_index import PostingIndex, restrict_rows
 from app.utils.query_vectorizer.abstract_query_vectorizer import AbstractQueryVectorizer
 from app.utils.search_processor import TextProcessor
+from app.utils.stage_executor import stage_executor
 from config import Config
 
 logger = logger.getChild(__name__)
 
 
+async def resolve_terms(text_processor: TextProcessor, tags_list: List[str], query: TagQuery) -> List[str]:
+    """Terms extracted from the query text plus the selected entities that are known tags."""
+    query_terms = await text_processor.extract_relevant_terms(query.query)
+
+    all_terms = list(set(query_terms + query.entities))
+    return [term for term in all_terms if term in tags_list]
+
+
 class TagQueryVectorizer(AbstractQueryVectorizer):
-    def __init__(self, text_processor: TextProcessor, tags_list: List[str]):
+    def __init__(self, text_processor: TextProcessor, tags_list: List[str], row_mask: Optional[np.ndarray] = None):
         self.vectorizer = self.__load_vectorizer()
-        self.vectors = self.__load_vectors()
+        # A shard worker keeps only the rows of the frames it owns.
+        self.vectors = restrict_rows(self.__load_vectors(), row_mask)
+        # Rows of multi_tag_vectors.npz are TF-IDF weights, so the postings
+        # of each tag carry its IDF.
+        self.index = PostingIndex(self.vectors)
         self.text_processor = text_processor
         self.tags_list = tags_list
         logger.debug(f'vectorizer: {self.vectorizer}')
@@ -35,23 +48,33 @@ class TagQueryVectorizer(AbstractQueryVectorizer):
         return load_npz(vectors_path)
 
     async def vectorize(self, query: TagQuery) -> Tuple[np.ndarray, List[str]]:
-        query_terms = await self.text_processor.extract_relevant_terms(query.query)
-        
-        all_terms = list(set(query_terms + query.entities))
-        existed_terms = [term for term in all_terms if term in self.tags_list]
-        
+        existed_terms = await resolve_terms(self.text_processor, self.tags_list, query)
+
         logger.info(
             f'All terms for vectorization: {existed_terms}')
-        term_vectors = self.vectorizer.transform([" ".join(existed_terms)])
+        term_vectors = await stage_executor.run(self.transform_terms, existed_terms)
         return term_vectors, existed_terms
 
-    def search(self, query_vector, k):
-        if query_vector.shape[0] > 1:
-            similarities = cosine_similarity(
-                self.vectors, query_vector).max(axis=1).flatten()
-        else:
-            similarities = cosine_similarity(
-                self.vectors, query_vector).flatten()
+    def transform_terms(self, terms: List[str]) -> np.ndarray:
+        return self.vectorizer.transform([" ".join(terms)])
+
+    def search(self, query_vector, k, id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return ``(similarities, indices)`` of the ``k`` most similar frames with a positive score, best first.
+
+        A multi-row query scores each frame by its best row. The overall top
+        ``k`` is contained in the union of the rows' top ``k``, so each row
+        is searched separately and the results are merged.
+        """
+        if query_vector.shape[0] <= 1:
+            return self.index.search(query_vector, k, id_mask)
 
-        top_indices = similarities.argsort()[-k:][::-1]
-        return similarities, top_indices
+        results = [self.index.search(query_vector[row], k, id_mask)
+                   for row in range(query_vector.shape[0])]
+        similarities = np.concatenate([scores for scores, _ in results])
+        indices = np.concatenate([ids for _, ids in results])
+        # Keep the best score of every frame, then rank like a single row.
+        order = np.lexsort((-similarities, indices))
+        first = np.flatnonzero(np.diff(indices[order], prepend=-1) != 0)
+        similarities, indices = similarities[order[first]], indices[order[first]]
+        order = np.lexsort((indices, -similarities))[:k]
+        return similarities[order], indices[order]
@@ -1,32 +1,68 @@
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 from app.utils.query_vectorizer.abstract_query_vectorizer import AbstractQueryVectorizer
 from app.utils.search_processor import TextProcessor
 from app.utils.embedder.abstract_embedder import AbstractTextEmbedder
+from app.utils.embedder.embedding_cache import EmbeddingCache
+from app.utils.binary_index import BinaryIndex
+from app.utils.embedding_store import EmbeddingStore, embedding_store_registry
+from app.utils.indexer import FaissIndexer, ShardedFaissIndexer
 from app.log import logger
+from config import Config
 import numpy as np
-import faiss
 
 logger = logger.getChild(__name__)
 
 
+SEARCH_MODES = ('index', 'binary')
+
+
 class TextQueryVectorizer(AbstractQueryVectorizer):
-    def __init__(self, embedder: AbstractTextEmbedder, text_processor: TextProcessor, faiss_index: faiss.Index):
+    def __init__(self, embedder: AbstractTextEmbedder, text_processor: TextProcessor, faiss_index: Optional[FaissIndexer], embedding_cache: Optional[EmbeddingCache] = None, embedding_store: Optional[EmbeddingStore] = None,
+                 search_mode: str = Config.TEXT_SEARCH_MODE, binary_index: Optional[BinaryIndex] = None, binary_rescore_depth: int = Config.BINARY_RESCORE_DEPTH):
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(
+                f'Unknown text search mode {search_mode!r}, expected one of {SEARCH_MODES}')
         self.embedder = embedder
         self.text_processor = text_processor
         self.faiss_index = faiss_index
+        self.embedding_cache = embedding_cache
+        # A search coordinator only embeds queries and has no local index.
+        self.embedding_store = embedding_store or (
+            embedding_store_registry.get(faiss_index) if faiss_index is not None else None)
+        self.binary_index = binary_index
+        self.binary_rescore_depth = binary_rescore_depth
+        self.search_mode = search_mode
+        if search_mode == 'binary' and binary_index is None:
+            logger.warning(
+                'Binary search mode needs binary codes; searching the FAISS index instead')
+            self.search_mode = 'index'
 
     async def vectorize(self, query: str) -> Tuple[np.ndarray, List[str]]:
         preprocessed_query = await self.parse_query(query)
         logger.info(
             f'Text processed query: {preprocessed_query}')
 
-        embedding = self.embedder.embed(preprocessed_query)
+        embedding = await self.embed(preprocessed_query)
 
         logger.debug(f"Final query vector shape: {embedding.shape}")
         logger.debug(f"Final query vector: {embedding}")
 
         return embedding
 
+    async def embed(self, preprocessed_query: str) -> np.ndarray:
+        if self.embedding_cache is None:
+            return await self.embedder.aembed(preprocessed_query)
+
+        model_name = self.embedder.model_name
+        embedding = self.embedding_cache.get(model_name, preprocessed_query)
+        if embedding is not None:
+            logger.debug(f'Embedding cache hit: {self.embedding_cache.stats()}')
+            return embedding
+
+        embedding = await self.embedder.aembed(preprocessed_query)
+        self.embedding_cache.put(model_name, preprocessed_query, embedding)
+        return embedding
+
     async def preprocess_query(self, query: str) -> str:
         return await self.text_processor.preprocess_query(query)
 
@@ -34,10 +70,71 @@ class TextQueryVectorizer(AbstractQueryVectorizer):
         preprocessed_query = await self.preprocess_query(query)
         return preprocessed_query
 
-    def search(self, query_vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    def search(self, query_vector: np.ndarray, k: int, search_params: Optional[Dict[str, int]] = None, id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top ``k`` frames for ``query_vector``, restricted to ``id_mask`` when given."""
+        if self.scans_exactly(id_mask):
+            if isinstance(self.faiss_index, ShardedFaissIndexer):
+                # The embedding matrix covers every shard; only scan the loaded ones.
+                id_mask = self.faiss_index.loaded_mask() & id_mask[:self.faiss_index.ntotal]
+            return self.rescore(query_vector, np.flatnonzero(id_mask), k)
+
+        if self.search_mode == 'binary':
+            return self.binary_search(query_vector, k)
+
         if query_vector.ndim == 1:
             query_vector = query_vector.reshape(1, -1)
 
-        distances, indices = self.faiss_index.search(query_vector, k)
+        distances, indices = self.faiss_index.search(
+            query_vector, k, search_params=search_params, id_mask=id_mask)
 
         return distances.flatten(), indices.flatten()
+
+    def scans_exactly(self, id_mask: Optional[np.ndarray]) -> bool:
+        """Whether a filtered search scores every allowed frame exactly instead of using the index.
+
+        Filters the FAISS index cannot apply itself (binary mode, wrapped
+        indexes, old FAISS builds) fall back to scanning the allowed rows of
+        the embedding matrix.
+        """
+        if id_mask is None:
+            return False
+        return self.search_mode == 'binary' or not self.faiss_index.supports_id_filter
+
+    def binary_search(self, query_vector: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Take the ``binary_rescore_depth`` nearest 1-bit codes by Hamming distance and re-score them exactly."""
+        _, candidate_indices = self.binary_index.search(
+            query_vector, max(self.binary_rescore_depth, k))
+        if isinstance(self.faiss_index, ShardedFaissIndexer):
+            # The 1-bit codes cover every shard; keep the loaded ones, and scan
+            # them all when too few candidates survive.
+            loaded = self.faiss_index.loaded_mask()
+            candidate_indices = candidate_indices[candidate_indices >= 0]
+            candidate_indices = candidate_indices[loaded[candidate_indices]]
+            if len(candidate_indices) < k:
+                candidate_indices = np.flatnonzero(loaded)
+        return self.rescore(query_vector, candidate_indices, k)
+
+    def rescore(self, query_vector: np.ndarray, candidate_indices: np.ndarray, k: int, chunk_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+        """Re-score candidates with exact inner products against the full vectors and keep the top ``k``.
+
+        Returns ``(scores, indices)`` like ``search``; the scores are what a
+        flat inner-product index would have returned for these frames.
+        Candidates are gathered ``chunk_size`` rows at a time.
+        """
+        candidate_indices = np.asarray(candidate_indices, dtype=np.int64).reshape(-1)
+        candidate_indices = candidate_indices[candidate_indices >= 0]
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+
+        best_scores = np.empty(0, dtype=np.float32)
+        best_indices = np.empty(0, dtype=np.int64)
+        for start in range(0, len(candidate_indices), chunk_size):
+            chunk = candidate_indices[start:start + chunk_size]
+            best_scores = np.concatenate(
+                [best_scores, self.embedding_store.get(chunk) @ query_vector])
+            best_indices = np.concatenate([best_indices, chunk])
+            if len(best_scores) > k > 0:
+                keep = np.sort(np.argpartition(-best_scores, k - 1)[:k])
+                best_scores, best_indices = best_scores[keep], best_indices[keep]
+
+        order = np.argsort(-best_scores, kind='stable')[:k]
+        return best_scores[order], best_indices[order]
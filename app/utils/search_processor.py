@@ -6,8 +6,11 @@ import spacy
 from spacy.cli import download
 from googletrans import Translator
 import asyncio
+from collections import OrderedDict
 from typing import List
 from app.log import logger
+from app.utils.stage_executor import stage_executor
+from config import Config
 
 nltk.download('punkt', quiet=True)
 nltk.download('stopwords', quiet=True)
@@ -30,19 +33,33 @@ class TextProcessor:
         self.stop_words = set(stopwords.words('english')) - {'and', 'or'}
         self.translator = Translator()
         self.lemmatizer = WordNetLemmatizer()
+        self.translation_cache: 'OrderedDict[str, str]' = OrderedDict()
+        self.translation_cache_size = Config.TRANSLATION_CACHE_SIZE
 
     async def translate_to_english(self, query):
+        cache_key = ' '.join(query.split())
+        if cache_key in self.translation_cache:
+            self.translation_cache.move_to_end(cache_key)
+            return self.translation_cache[cache_key]
+
         try:
             detected_lang = await asyncio.to_thread(self.translator.detect, query)
             logger.info(f"Detected language: {detected_lang.lang}")
 
             if detected_lang.lang != 'en':
                 translated = await asyncio.to_thread(self.translator.translate, query, dest='en')
-                return translated.text
-            return query
+                result = translated.text
+            else:
+                result = query
         except Exception as e:
+            # Failures are not cached so the next request retries the translator.
             logger.error(f"Translation error: {str(e)}")
             return query
+
+        self.translation_cache[cache_key] = result
+        if len(self.translation_cache) > self.translation_cache_size:
+            self.translation_cache.popitem(last=False)
+        return result
         
     def get_wordnet_pos(self, treebank_tag):
         if treebank_tag.startswith('J'):
@@ -57,6 +74,9 @@ class TextProcessor:
             return nltk.corpus.wordnet.NOUN
 
     async def extract_relevant_terms(self, text: str) -> List[str]:
+        return await stage_executor.run(self._extract_relevant_terms, text)
+
+    def _extract_relevant_terms(self, text: str) -> List[str]:
         tokens = word_tokenize(text)
         pos_tags = pos_tag(tokens)
 
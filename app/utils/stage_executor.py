@@ -0,0 +1,29 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from config import Config
+
+
+class StageExecutor:
+    """Bounded thread pool for the blocking parts of search stages.
+
+    CLIP encoding, FAISS search and NumPy/SciPy scoring release the GIL, so
+    running them here lets the text, tag and object stages of one query
+    overlap instead of taking turns on the event loop.
+    """
+
+    def __init__(self, max_workers: int = Config.SEARCH_EXECUTOR_WORKERS):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='search-stage')
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+stage_executor = StageExecutor()
@@ -0,0 +1,61 @@
+"""Compare the dense cosine scan of the object-grid search with the posting index.
+
+Queries are random grid queries of a few ``<cell><label>`` tokens drawn from
+the vocabulary of ``bbox_vectorizer.pkl``.
+
+Usage:
+    python -m benchmarks.object_search_benchmark --queries 200 --terms 3 -k 1050
+"""
+import argparse
+import time
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from app.utils.query_vectorizer.object_detection_vectorizer import ObjectQueryVectorizer
+
+
+def dense_search(vectors, query_vector, k: int):
+    """Copy of the previous ``ObjectQueryVectorizer.search``."""
+    similarities = cosine_similarity(vectors, query_vector).flatten()
+    top_indices = similarities.argsort()[-k:][::-1]
+    top_indices = top_indices[similarities[top_indices] > 0]
+    return similarities[top_indices], top_indices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--terms', type=int, default=3)
+    parser.add_argument('-k', type=int, default=1050)
+    args = parser.parse_args()
+
+    vectorizer = ObjectQueryVectorizer()
+    vocabulary = sorted(vectorizer.vectorizer.vocabulary_)
+    rng = np.random.default_rng(0)
+    queries = [vectorizer.vectorizer.transform([' '.join(rng.choice(vocabulary, size=args.terms))])
+               for _ in range(args.queries)]
+    print(f'{vectorizer.vectors.shape[0]} frames, {len(vocabulary)} tokens, {args.queries} queries')
+
+    dense_time, index_time, max_difference, same_sets = 0.0, 0.0, 0.0, 0
+    for query in queries:
+        start = time.perf_counter()
+        dense_scores, dense_ids = dense_search(vectorizer.vectors, query, args.k)
+        dense_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_scores, index_ids = vectorizer.search(query, args.k)
+        index_time += time.perf_counter() - start
+
+        n = min(len(dense_scores), len(index_scores))
+        if n:
+            max_difference = max(max_difference, float(
+                np.max(np.abs(np.sort(dense_scores)[::-1][:n] - index_scores[:n]))))
+        same_sets += set(dense_ids[dense_scores > dense_scores.min()]) <= set(index_ids) if len(dense_ids) else 1
+
+    print(f'dense cosine scan: {dense_time / args.queries * 1000:8.2f} ms/query')
+    print(f'posting index:     {index_time / args.queries * 1000:8.2f} ms/query')
+    print(f'max score difference: {max_difference:.2e}')
+    print(f'queries with the same top-k (up to ties at the cut): {same_sets}/{args.queries}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Recall of the approximate text search paths against exact flat search.
+
+Queries are keyframe embeddings with Gaussian noise added (CLIP text and
+image embeddings share one space, so this needs no text model). Ground truth
+is the exact inner-product top-k over the full embedding matrix.
+
+Usage:
+    python -m benchmarks.text_search_recall --queries 200 -k 100 --depths 1000 2000 4000
+    python -m benchmarks.text_search_recall --index notebooks/indexing/faiss_clipv2_cosine_opq_ivf_pq.bin
+"""
+import argparse
+import time
+from typing import Callable
+import numpy as np
+from app.utils.binary_index import BinaryIndex, binarize
+from app.utils.embedding_store import embedding_store_registry
+from app.utils.indexer import FaissIndexer, faiss_index_registry
+from config import Config
+
+
+def make_queries(store, n_queries: int, noise: float, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(len(store), size=n_queries, replace=False))
+    queries = store.get(ids) + rng.normal(0, noise, (n_queries, store.dim)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def exact_top_k(store, queries: np.ndarray, k: int, batch_size: int = 65536) -> np.ndarray:
+    best_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    for start in range(0, len(store), batch_size):
+        scores = queries @ store.get_range(
+            start, min(batch_size, len(store) - start)).T
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, np.broadcast_to(
+            np.arange(start, start + scores.shape[1] - k), (len(queries), scores.shape[1] - k))], axis=1)
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids
+
+
+def rescore(store, query: np.ndarray, candidates: np.ndarray, k: int) -> np.ndarray:
+    candidates = candidates[candidates >= 0]
+    scores = store.get(candidates) @ query
+    return candidates[np.argsort(-scores, kind='stable')[:k]]
+
+
+def evaluate(name: str, search: Callable[[np.ndarray], np.ndarray], queries: np.ndarray, truth: np.ndarray, k: int):
+    found, elapsed = 0, 0.0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        ids = search(query)
+        elapsed += time.perf_counter() - start
+        found += len(np.intersect1d(ids[:k], expected))
+    recall = found / truth.size
+    print(f'{name:<36} recall@{k}: {recall:6.3f}   {elapsed / len(queries) * 1000:8.2f} ms/query')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--flat-index', default=Config.FAISS_FLAT_BIN_PATH)
+    parser.add_argument('--embeddings', default=Config.CLIP_EMBEDDINGS_PATH)
+    parser.add_argument('--index', default=None,
+                        help='Also report an ANN index, with and without re-scoring')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=0.03)
+    parser.add_argument('-k', type=int, default=100)
+    parser.add_argument('--depths', type=int, nargs='+',
+                        default=[1000, 2000, 4000])
+    args = parser.parse_args()
+
+    store = embedding_store_registry.get(
+        faiss_index_registry.get(args.flat_index), args.embeddings)
+    queries = make_queries(store, args.queries, args.noise)
+    truth = exact_top_k(store, queries, args.k)
+    print(f'{len(store)} vectors, {len(queries)} queries')
+
+    codes = np.concatenate([binarize(store.get_range(start, min(65536, len(store) - start)))
+                            for start in range(0, len(store), 65536)])
+    for backend in ('faiss', 'numpy'):
+        binary_index = BinaryIndex(codes, backend=backend)
+        evaluate(f'binary ({backend}), no re-scoring',
+                 lambda q: binary_index.search(q, args.k)[1], queries, truth, args.k)
+        for depth in args.depths:
+            evaluate(f'binary ({backend}) + re-score {depth}',
+                     lambda q: rescore(store, q, binary_index.search(q, depth)[1], args.k),
+                     queries, truth, args.k)
+
+    if args.index:
+        indexer = FaissIndexer(args.index)
+        print(f'ANN index: {indexer.describe()}')
+        evaluate(f"{indexer.index_type}, no re-scoring",
+                 lambda q: indexer.search(q, args.k)[1][0], queries, truth, args.k)
+        for depth in args.depths:
+            evaluate(f'{indexer.index_type} + re-score {depth}',
+                     lambda q: rescore(store, q, indexer.search(q, depth)[1][0], args.k),
+                     queries, truth, args.k)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Compare per-class grid encoding with the whole-dataset batch encoder.
+
+Usage:
+    python -m benchmarks.visual_encoding_benchmark --frames 20000 --max-per-class 8
+"""
+import argparse
+import time
+import numpy as np
+from app.models import Category
+from app.utils.data_manager.visual_encoding_manager import VisualEncodingManager
+
+LABELS = [category.value for category in Category]
+
+
+def make_dataset(n_frames: int, max_per_class: int, classes_per_frame: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n_frames):
+        width, height = 1280, 720
+        objects = {}
+        for label_id in rng.choice(len(LABELS), size=classes_per_frame, replace=False):
+            n = int(rng.integers(1, max_per_class + 1))
+            x1 = rng.uniform(0, width * 0.9, n)
+            y1 = rng.uniform(0, height * 0.9, n)
+            x2 = np.minimum(x1 + rng.uniform(10, width * 0.3, n), width)
+            y2 = np.minimum(y1 + rng.uniform(10, height * 0.3, n), height)
+            objects[int(label_id)] = [
+                {'score': 0.9, 'box': [float(a), float(b), float(c), float(d)]}
+                for a, b, c, d in zip(x1, y1, x2, y2)]
+        frames.append((width, height, objects))
+    return frames
+
+
+def legacy_encode_bboxes(grid_bboxes, grid_labels, bboxes, labels):
+    """Copy of the previous ``VisualEncoding.encode_bboxes``."""
+    context = []
+    for bbox, label in zip(bboxes, labels):
+        x, y = (bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2
+        grid_idx = np.argmin(
+            np.sum((grid_bboxes[:, :2] - np.array([x, y]))**2, axis=1))
+        context.append(f"{grid_labels[grid_idx]}{label.replace(' ', '')}")
+    return ' '.join(context)
+
+
+def legacy_encode(manager: VisualEncodingManager, frames):
+    """The previous path: one ``encode_bboxes`` call over the class's whole box list per box."""
+    encoder = manager.encoder
+    tokens = []
+    for width, height, objects in frames:
+        for label_id, items in objects.items():
+            bboxes = [[item['box'][0] / width, item['box'][1] / height,
+                       item['box'][2] / width, item['box'][3] / height] for item in items]
+            for _ in bboxes:
+                tokens.append(legacy_encode_bboxes(
+                    encoder.grid_bboxes, encoder.grid_labels, np.array(bboxes), [LABELS[label_id]]))
+    return tokens
+
+
+def reference_cells(manager: VisualEncodingManager, frames):
+    """Per-box argmin, used to check the batch encoder cell by cell."""
+    encoder = manager.encoder
+    cells = []
+    for width, height, objects in frames:
+        for items in objects.values():
+            for item in items:
+                box = item['box']
+                x = (box[0] / width + box[2] / width) / 2
+                y = (box[1] / height + box[3] / height) / 2
+                cells.append(int(np.argmin(
+                    np.sum((encoder.grid_bboxes[:, :2] - np.array([x, y]))**2, axis=1))))
+    return np.array(cells)
+
+
+def batch_encode(manager: VisualEncodingManager, frames):
+    boxes, widths, heights, label_ids = [], [], [], []
+    for width, height, objects in frames:
+        for label_id, items in objects.items():
+            for item in items:
+                boxes.append(item['box'])
+                widths.append(width)
+                heights.append(height)
+                label_ids.append(label_id)
+    _, token_ids, tokens = manager.encode_dataset(
+        np.array(boxes), np.array(widths, dtype=np.float64), np.array(heights, dtype=np.float64),
+        np.array(label_ids), LABELS)
+    return token_ids, tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--frames', type=int, default=5000)
+    parser.add_argument('--max-per-class', type=int, default=8)
+    parser.add_argument('--classes-per-frame', type=int, default=3)
+    args = parser.parse_args()
+
+    manager = VisualEncodingManager(LABELS)
+    frames = make_dataset(args.frames, args.max_per_class,
+                          args.classes_per_frame)
+    n_boxes = sum(len(items) for _, _, objects in frames
+                  for items in objects.values())
+    print(f'{args.frames} frames, {n_boxes} boxes')
+
+    start = time.perf_counter()
+    legacy_encode(manager, frames)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    token_ids, tokens = batch_encode(manager, frames)
+    batch_time = time.perf_counter() - start
+
+    token_cells = np.array([manager.encoder.grid_labels.index(token[:2])
+                           for token in tokens])
+    mismatches = int(np.sum(reference_cells(
+        manager, frames) != token_cells[token_ids]))
+
+    print(f'legacy per-box loop: {legacy_time * 1000:10.1f} ms')
+    print(f'batch encoder:       {batch_time * 1000:10.1f} ms')
+    print(f'speedup:             {legacy_time / batch_time:10.1f}x')
+    print(f'cell mismatches vs per-box argmin: {mismatches}')
+
+
+if __name__ == '__main__':
+    main()
@@ -14,16 +14,99 @@ class Config:
     
     OD_ENCODED_DIR = f'{METADATA_ENCODED_DIR}/object_detection'
     TAG_ENCODED_DIR = f'{METADATA_ENCODED_DIR}/multi_tag'
+    FRAME_SNAPSHOT_DIR = f'{METADATA_ENCODED_DIR}/frame_snapshot'
 
     METADATA_DIR = f'{BASE_DIR}/notebooks'
-    FAISS_BIN_PATH = f'{BASE_DIR}/notebooks/indexing/faiss_clipv2_cosine_cpu.bin'
+    # Exact index built by the indexing notebook; ANN variants are built from it.
+    FAISS_FLAT_BIN_PATH = f'{BASE_DIR}/notebooks/indexing/faiss_clipv2_cosine_cpu.bin'
+    # One index per video batch folder (L01, L02, ...) with global ids.
+    FAISS_SHARD_DIR = f'{BASE_DIR}/notebooks/indexing/faiss_clipv2_shards'
+    FAISS_INDEX_PATHS = {
+        'flat': FAISS_FLAT_BIN_PATH,
+        'ivf_flat': f'{BASE_DIR}/notebooks/indexing/faiss_clipv2_cosine_ivf_flat.bin',
+        'hnsw': f'{BASE_DIR}/notebooks/indexing/faiss_clipv2_cosine_hnsw.bin',
+        'ivf_pq': f'{BASE_DIR}/notebooks/indexing/faiss_clipv2_cosine_opq_ivf_pq.bin',
+        'sharded': FAISS_SHARD_DIR,
+    }
+    FAISS_INDEX_TYPE = os.getenv('FAISS_INDEX_TYPE', 'flat')
+    FAISS_BIN_PATH = FAISS_INDEX_PATHS[FAISS_INDEX_TYPE]
+    # Comma-separated shards to load at startup; empty loads every shard.
+    FAISS_SHARDS = [name for name in os.getenv(
+        'FAISS_SHARDS', '').split(',') if name]
+    FAISS_SHARD_WORKERS = int(os.getenv('FAISS_SHARD_WORKERS', 4))
+    # 0 lets the builder pick 4 * sqrt(ntotal) lists.
+    FAISS_IVF_NLIST = int(os.getenv('FAISS_IVF_NLIST', 0))
+    # Bytes per vector of the OPQ+IVF-PQ index; must divide the dimension.
+    FAISS_PQ_CODE_SIZE = int(os.getenv('FAISS_PQ_CODE_SIZE', 64))
+    FAISS_HNSW_M = int(os.getenv('FAISS_HNSW_M', 32))
+    FAISS_HNSW_EF_CONSTRUCTION = int(
+        os.getenv('FAISS_HNSW_EF_CONSTRUCTION', 200))
+    FAISS_NPROBE = int(os.getenv('FAISS_NPROBE', 32))
+    FAISS_EF_SEARCH = int(os.getenv('FAISS_EF_SEARCH', 128))
+    # Candidates re-scored exactly against the embedding matrix; 0 disables
+    # re-scoring. On by default for the compressed index.
+    TEXT_RESCORE_DEPTH = int(os.getenv(
+        'TEXT_RESCORE_DEPTH', 2000 if FAISS_INDEX_TYPE == 'ivf_pq' else 0))
+    # 'index' searches the FAISS index; 'binary' takes BINARY_RESCORE_DEPTH
+    # Hamming neighbours of the 1-bit codes and re-scores them exactly.
+    TEXT_SEARCH_MODE = os.getenv('TEXT_SEARCH_MODE', 'index')
+    BINARY_RESCORE_DEPTH = int(os.getenv('BINARY_RESCORE_DEPTH', 4000))
+    BINARY_SEARCH_BACKEND = os.getenv('BINARY_SEARCH_BACKEND', 'faiss')
+    CLIP_EMBEDDINGS_PATH = f'{BASE_DIR}/notebooks/indexing/clip_embeddings.npy'
+    CLIP_BINARY_CODES_PATH = f'{BASE_DIR}/notebooks/indexing/clip_binary_codes.npy'
+    KNN_GRAPH_DIR = f'{BASE_DIR}/notebooks/indexing/knn_graph'
+    KNN_GRAPH_K = int(os.getenv('KNN_GRAPH_K', 16))
+    KNN_GRAPH_CHECK_SAMPLES = int(os.getenv('KNN_GRAPH_CHECK_SAMPLES', 32))
     RESULTS_DIR = f'{BASE_DIR}'
 
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
     REDIS_DB = int(os.getenv('REDIS_DB', 0))
+    REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 32))
+    REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 2.0))
+    REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', 5.0))
 
     CLIP_MODEL_NAME = "ViT-L-14"
+    EMBEDDING_CACHE_MAX_ENTRIES = int(
+        os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', 4096))
+    # Leave empty to keep the embedding cache in memory only.
+    EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', '')
+    EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', 32))
+    EMBEDDING_BATCH_MAX_WAIT_MS = float(
+        os.getenv('EMBEDDING_BATCH_MAX_WAIT_MS', 5))
     USER_ID = "default_user"
     
     MAX_FRAMES_PER_FILE = 100
+    # Per-category object counts from 1 up to this value get their own
+    # bitmap; larger counts share the last one.
+    OBJECT_COUNT_BUCKETS = int(os.getenv('OBJECT_COUNT_BUCKETS', 10))
+    # Object postings are also precomputed with every detection spread to
+    # the grid cells up to this distance away, each step scaling its weight
+    # by OBJECT_NEIGHBOUR_WEIGHT; queries pick a level with spatial_tolerance.
+    OBJECT_MAX_SPATIAL_TOLERANCE = int(
+        os.getenv('OBJECT_MAX_SPATIAL_TOLERANCE', 1))
+    OBJECT_NEIGHBOUR_WEIGHT = float(os.getenv('OBJECT_NEIGHBOUR_WEIGHT', 0.5))
+
+    SEARCH_CANDIDATE_DEPTH = int(os.getenv('SEARCH_CANDIDATE_DEPTH', 1000))
+    CANDIDATE_CACHE_MAX_ENTRIES = int(
+        os.getenv('CANDIDATE_CACHE_MAX_ENTRIES', 256))
+    CANDIDATE_CACHE_TTL_SECONDS = float(
+        os.getenv('CANDIDATE_CACHE_TTL_SECONDS', 600))
+    CANDIDATE_CACHE_MAX_BYTES = int(
+        os.getenv('CANDIDATE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', 1024))
+
+    SEARCH_EXECUTOR_WORKERS = int(os.getenv('SEARCH_EXECUTOR_WORKERS', 8))
+    SEARCH_STAGE_DEADLINE_SECONDS = float(
+        os.getenv('SEARCH_STAGE_DEADLINE_SECONDS', 10))
+    SEARCH_STAGE_DEADLINES = {
+        'text': float(os.getenv('SEARCH_TEXT_DEADLINE_SECONDS', SEARCH_STAGE_DEADLINE_SECONDS)),
+        'tag': float(os.getenv('SEARCH_TAG_DEADLINE_SECONDS', SEARCH_STAGE_DEADLINE_SECONDS)),
+        'object': float(os.getenv('SEARCH_OBJECT_DEADLINE_SECONDS', SEARCH_STAGE_DEADLINE_SECONDS)),
+    }
+    # Shard worker base URLs (http://127.0.0.1:8101,...); when set, the app
+    # runs as a search coordinator and the workers own the CLIP index.
+    SEARCH_SHARD_URLS = [url for url in os.getenv(
+        'SEARCH_SHARD_URLS', '').split(',') if url]
+    SEARCH_SHARD_TIMEOUT_SECONDS = float(
+        os.getenv('SEARCH_SHARD_TIMEOUT_SECONDS', 10))